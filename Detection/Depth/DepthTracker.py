@@ -159,6 +159,10 @@ if __name__ == '__main__':
     cv2.namedWindow("Depth ColorMap", cv2.WINDOW_NORMAL)
     cv2.namedWindow("Depth ROI", cv2.WINDOW_NORMAL)
 
+    # Intrinsics per stream profile, looked up again only when the profile changes
+    depth_profile_id, depth_intrinsics = None, None
+    color_profile_id, color_intrinsics = None, None
+
     try:
         while True:
             # Get frames and align
@@ -173,9 +177,13 @@ if __name__ == '__main__':
             for f in filters:
                 depth_frame = f.process(depth_frame)
 
-            # Grab new intrinsics (may be changed by decimation)
-            depth_intrinsics = rs.video_stream_profile(depth_frame.profile).get_intrinsics()
-            color_intrinsics = rs.video_stream_profile(color_frame.profile).get_intrinsics()
+            # Grab new intrinsics only when the profile changed (decimation outputs a profile with a new id)
+            if depth_frame.profile.unique_id() != depth_profile_id:
+                depth_profile_id = depth_frame.profile.unique_id()
+                depth_intrinsics = rs.video_stream_profile(depth_frame.profile).get_intrinsics()
+            if color_frame.profile.unique_id() != color_profile_id:
+                color_profile_id = color_frame.profile.unique_id()
+                color_intrinsics = rs.video_stream_profile(color_frame.profile).get_intrinsics()
 
             # Create a numpy array images using this protocol with no data marshalling overhead:
             depth_image = np.asanyarray(depth_frame.get_data())
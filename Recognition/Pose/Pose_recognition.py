@@ -65,27 +65,29 @@ def draw_landmarks(frame, result, connections=False):
 
 if __name__ == "__main__":
 
+    # Initialize variables for efficient frame processing
+    reduction = 2   
+    reduced_rgb = f"rgb@{1 / reduction}"
+
     # Create the camera stream and the pose landmarker
-    cam = CameraStream(0)
+    # The camera thread reduces the frame size and converts BGR to RGB for Mediapipe
+    cam = CameraStream(0, outputs=[reduced_rgb])
     landmarker, latest = create_landmarker()
 
-    # Initialize variables for efficient frame processing
-    reduction = 2   
     frame_counter = 0
     inference_interval = 2
+    seq = 0
 
     while True:
 
-        frame = cam.read()
-        if frame is None:
+        # Block until the camera has a frame we have not processed yet
+        new = cam.read_new(seq, timeout=1.0, output=("bgr", reduced_rgb))
+        if new is None:
             continue
+        seq, _, (frame, rgb) = new
 
         # Run inference every N frames
         if frame_counter % inference_interval == 0:
-            # Reduce the frame size for faster inference
-            reduced = cv2.resize(frame, None, fx=1 / reduction, fy=1 / reduction)
-            # Convert BGR to RGB for Mediapipe
-            rgb = cv2.cvtColor(reduced, cv2.COLOR_BGR2RGB)
             # Create a Mediapipe Image object from the RGB frame
             mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
             # Run the pose landmarker asynchronously on the reduced RGB frame
@@ -101,5 +103,6 @@ if __name__ == "__main__":
         if cv2.waitKey(1) & 0xFF == 27:
             break
 
+    print(f"Camera stats: {cam.stats()}")
     cam.stop()
     cv2.destroyAllWindows()
\ No newline at end of file
@@ -20,8 +20,8 @@ if __name__ == '__main__':
     tracker = ROITracker()                     # Instantiate roi tracker
     selector = SimpleROISelector(window_name)  # Instantiate roi selector
 
-    # Control flags
-    intrinsics_set = False
+    # Calibration the tracker currently uses
+    calibration = None
 
     # Start the camera
     camera.start_async()
@@ -35,10 +35,11 @@ if __name__ == '__main__':
         depth_image = frame.depth_map
 
         # Ensure the camera intrinsics passed to the tracker (this is required for 3D deprojeciton)
-        if not intrinsics_set:
-            tracker.intrinsics = camera.color_intrinsics
-            tracker.depth_scale = camera.depth_scale
-            intrinsics_set = True
+        # The frame carries the cached calibration, it only changes with the stream profile
+        if frame.color_calibration is not calibration:
+            calibration = frame.color_calibration
+            tracker.intrinsics = (calibration.camera_matrix, calibration.distortion)
+            tracker.depth_scale = frame.depth_scale
 
         # Check if there is a new roi to track
         if selector.is_new_roi:
@@ -62,6 +63,6 @@ if __name__ == '__main__':
         selector.update_ux(color_image)
 
         # Apply colormap to depth data (optional) and update image windows
-        depth_image = cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.03), cv2.COLORMAP_JET)
+        depth_image = frame.depth_colormap
         cv2.imshow(window_name, np.hstack((color_image, depth_image)))
         cv2.waitKey(1)
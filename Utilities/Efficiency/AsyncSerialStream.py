@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+import itertools
+import serial
+from collections import deque
+
+from SerialStream import SampleRing
+
+
+class AsyncSerialStream:
+
+    # Same read()/write() surface as SerialStream, but driven by the event loop instead of a thread per port.
+    # Must be created inside a running loop, and needs a POSIX file descriptor (Linux/macOS, not Windows).
+
+    def __init__(self, port, baudrate=9600, buffer_size=100, parser=None, recorder=None):
+        self.recorder = recorder
+        self.ser = serial.Serial(port=port, baudrate=baudrate, timeout=0)
+        self.fd = self.ser.fileno()
+        os.set_blocking(self.fd, False)
+
+        self.buffer = deque(maxlen=buffer_size)
+        self.latest = None
+
+        self.parser = parser
+        self.samples = SampleRing(parser.dtype, buffer_size) if parser is not None else None
+
+        self.pending = bytearray()      # Received bytes that do not form a complete record yet
+        self.outgoing = bytearray()     # Bytes the port did not accept yet
+        self.waiters = []
+
+        self.loop = asyncio.get_running_loop()
+        self.running = True
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            chunk = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            # Device went away (EIO on a closed pty)
+            self.loop.remove_reader(self.fd)
+            return
+        if not chunk:
+            return
+        if self.recorder is not None:
+            self.recorder.record(chunk)
+
+        timestamp = time.time_ns()
+        self.pending += chunk
+        for record in self._records():
+            self._store(record, timestamp)
+
+    def _records(self):
+        if self.parser is None or not self.parser.binary:
+            while (end := self.pending.find(b"\n")) >= 0:
+                record = bytes(self.pending[:end + 1])
+                del self.pending[:end + 1]
+                yield record
+            return
+
+        header, size = self.parser.header, self.parser.size
+        while True:
+            start = 0
+            if header:
+                start = self.pending.find(header)
+                if start < 0:
+                    # Keep a possible partial header
+                    del self.pending[:max(0, len(self.pending) - len(header) + 1)]
+                    return
+                start += len(header)
+            if len(self.pending) < start + size:
+                return
+            record = bytes(self.pending[start:start + size])
+            del self.pending[:start + size]
+            yield record
+
+    def _store(self, record, timestamp):
+        if self.parser is not None:
+            values = self.parser.parse(record)
+            if values is None:
+                return
+            self.samples.append((timestamp,) + values)
+            result = self.samples.last(1)[0]
+        else:
+            self.latest = record.decode('utf-8', errors='ignore').strip()
+            self.buffer.append({timestamp: self.latest})
+            result = self.latest
+
+        waiters, self.waiters = self.waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(result)
+
+    async def next(self, timeout=None):
+        # Waits for the next record without polling
+        future = self.loop.create_future()
+        self.waiters.append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def write(self, message):
+        self.outgoing += f'[PY] {message}\n'.encode('ascii')
+        self._flush()
+
+    def _flush(self):
+        try:
+            written = os.write(self.fd, self.outgoing)
+        except BlockingIOError:
+            written = 0
+        del self.outgoing[:written]
+
+        # Let the loop tell us when the port can take the rest
+        if self.outgoing:
+            self.loop.add_writer(self.fd, self._flush)
+        else:
+            self.loop.remove_writer(self.fd)
+
+    def read(self, n_latest=None):
+        if self.parser is not None:
+            if n_latest is None:
+                latest = self.samples.last(1)
+                return latest[0] if len(latest) else None
+            return self.samples.last(n_latest)
+
+        if n_latest is None:
+            return self.latest
+
+        n_latest = min(n_latest, len(self.buffer))
+        return list(itertools.islice(reversed(self.buffer), n_latest))[::-1]
+
+    def stop(self):
+        self.running = False
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.ser.close()
+
+
+if __name__ == "__main__":
+
+    async def main(ports):
+        # One event loop serves every port
+        streams = [AsyncSerialStream(port=port, baudrate=9600) for port in ports]
+        try:
+            while True:
+                for stream in streams:
+                    print(f"{stream.ser.port}: {stream.read()}")
+                    stream.write("Hello from Python!")
+                await asyncio.sleep(1)
+        finally:
+            for stream in streams:
+                stream.stop()
+
+    asyncio.run(main(['/dev/ttyUSB0']))
@@ -0,0 +1,135 @@
+import cv2
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from CameraStream import CameraStream
+
+
+class CameraGroup:
+
+    def __init__(self, sources=(0, 1), ring_size=None, outputs=None):
+        # The group owns the capture loop, the streams only hold buffers, outputs and counters
+        self.streams = [CameraStream(src, ring_size=ring_size, outputs=outputs, start=False) for src in sources]
+        self.pool = ThreadPoolExecutor(max_workers=len(self.streams), thread_name_prefix="CameraGroup")
+        self.running = True
+        self.ended = False
+
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.timestamp = None
+        self.skew = 0.0
+        self.frames = None
+        self.outputs = None
+        self.sets_captured = 0
+        self.sets_incomplete = 0
+        self.max_skew = 0.0
+
+        self.thread = threading.Thread(target=self.update, daemon=True)
+        self.thread.start()
+
+    def update(self):
+        backoff = 0.0
+        while self.running:
+
+            # Grab on every device back to back, this is what keeps the cameras in sync
+            grabbed = []
+            stamps = []
+            for stream in self.streams:
+                grabbed.append(stream.cap.grab())
+                stamps.append(time.time())
+
+            # Decoding is the slow part and releases the GIL, do it in parallel
+            rets = list(self.pool.map(CameraStream.retrieve, self.streams, grabbed, stamps))
+
+            # A replayed file that ran out ends the group, there will be no complete set anymore
+            if any(not ok and stream.mode is not None for ok, stream in zip(grabbed, self.streams)):
+                for stream in self.streams:
+                    stream._end()
+                with self.cond:
+                    self.ended = True
+                    self.cond.notify_all()
+                break
+
+            with self.cond:
+                if not all(rets):
+                    # A device that stopped delivering is retried with a growing pause (10 ms up to 0.5 s)
+                    self.sets_incomplete += 1
+                    backoff = min(max(2 * backoff, 0.01), 0.5)
+                    self.cond.wait_for(lambda: not self.running, backoff)
+                    continue
+
+                backoff = 0.0
+                self.seq += 1
+                self.timestamp = (stamps[0] + stamps[-1]) / 2
+                self.skew = stamps[-1] - stamps[0]
+                self.max_skew = max(self.max_skew, self.skew)
+                self.frames = tuple(stream.frame for stream in self.streams)
+                self.outputs = tuple(stream.outputs for stream in self.streams)
+                self.sets_captured += 1
+                self.cond.notify_all()
+
+    def _current(self, output):
+        if output is None:
+            images = self.frames
+        else:
+            images = tuple(outputs[output] for outputs in self.outputs)
+
+        if self.streams[0].ring is None:
+            return images
+        return tuple(CameraStream._readonly(image) for image in images)
+
+    def read(self, output=None):
+        with self.cond:
+            if self.seq > 0:
+                return self._current(output)
+        return None
+
+    def read_new(self, after_seq=0, timeout=None, output=None):
+        # Returns (seq, timestamp, frames, skew) where skew is the time between the first and last grab
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq or not self.running or self.ended, timeout):
+                return None
+            if self.seq <= after_seq:
+                return None
+            return self.seq, self.timestamp, self._current(output), self.skew
+
+    def stats(self):
+        with self.cond:
+            return {"captured": self.sets_captured,
+                    "incomplete": self.sets_incomplete,
+                    "skew": self.skew,
+                    "max_skew": self.max_skew}
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+        self.pool.shutdown()
+        for stream in self.streams:
+            stream.stop()
+
+
+if __name__ == "__main__":
+
+    group = CameraGroup([0, 1])
+    seq = 0
+
+    while True:
+        new = group.read_new(seq, timeout=1.0)
+        if new is None:
+            continue
+        seq, timestamp, frames, skew = new
+
+        view = np.hstack([cv2.resize(frame, (320, 240)) for frame in frames])
+        cv2.putText(view, f"skew {skew * 1000:.2f} ms", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        cv2.imshow("Camera Group", view)
+
+        if cv2.waitKey(1) & 0xFF == 27:
+            break
+
+    print(group.stats())
+    group.stop()
+    cv2.destroyAllWindows()
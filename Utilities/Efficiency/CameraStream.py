@@ -1,41 +1,423 @@
 import cv2
+import os
 import threading
+import time
+import numpy as np
+from collections import deque
+
+# Derived outputs are declared as "<conversion>[@<scale>]", e.g. "gray", "rgb@0.5" or "bgr@0.25"
+CONVERSIONS = {"bgr": None,
+               "gray": cv2.COLOR_BGR2GRAY,
+               "rgb": cv2.COLOR_BGR2RGB,
+               "hsv": cv2.COLOR_BGR2HSV}
+
+
+def parse_output(spec):
+    name, _, scale = spec.partition("@")
+    if name not in CONVERSIONS:
+        raise ValueError(f"unknown output '{spec}', expected one of {list(CONVERSIONS)} with an optional @scale")
+    scale = float(scale) if scale else 1.0
+    if scale <= 0:
+        raise ValueError(f"scale of output '{spec}' must be > 0")
+    return CONVERSIONS[name], scale
+
+
+class ImageFolderCapture:
+
+    # Minimal cv2.VideoCapture look-alike that replays a directory of images in name order
+    EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+    def __init__(self, path, fps=30):
+        self.files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(self.EXTENSIONS))
+        self.fps = fps
+        self.position = 0
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+    def grab(self):
+        if self.position >= len(self.files):
+            return False
+        self.position += 1
+        return True
+
+    def retrieve(self, image=None):
+        frame = cv2.imread(self.files[self.position - 1])
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.files)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return 0
+
+    def release(self):
+        self.files = []
+
+
+class FrameLease:
+
+    def __init__(self, stream, slot, frame, seq=0, timestamp=None, outputs=None):
+        self.frame = frame
+        self.seq = seq
+        self.timestamp = timestamp
+        self.outputs = outputs or {}
+        self._stream = stream
+        self._slot = slot
+
+    def release(self):
+        if self._stream is not None:
+            self._stream._release(self._slot)
+            self._stream = None
+
+    def __enter__(self):
+        return self.frame
+
+    def __exit__(self, *exc):
+        self.release()
+
 
 class CameraStream:
 
-    def __init__(self, src=0):
-        self.cap = cv2.VideoCapture(src)
+    def __init__(self, src=0, ring_size=None, outputs=None, start=True, mode=None, fps=None, readahead=8):
+        # A video file or an image folder is replayed, anything else (an index, /dev/video0, a URL) is a live device
+        replay = isinstance(src, str) and (os.path.isfile(src) or os.path.isdir(src))
+        if mode not in (None, "realtime", "unthrottled"):
+            raise ValueError(f"mode must be 'realtime' or 'unthrottled', got {mode}")
+        if mode is not None and not replay:
+            raise ValueError(f"mode '{mode}' needs a video file or image folder, got {src}")
+
+        # realtime: paced at the recorded fps, frames are dropped when the consumer lags
+        # unthrottled: every frame is handed out, decoding runs up to readahead frames ahead
+        self.mode = "realtime" if replay and mode is None else mode
+        self.cap = ImageFolderCapture(src, fps or 30) if replay and os.path.isdir(src) else cv2.VideoCapture(src)
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.readahead = readahead
+        self.queue = deque()
+        self.position = 0
+        self.ended = False
+
         self.ret, self.frame = self.cap.read()
         self.running = True
 
+        # Derived outputs are computed once per frame on the capture thread and published with it
+        self.output_specs = {spec: parse_output(spec) for spec in (outputs or [])}
+        self.outputs = {}
+
+        # Every published frame gets a sequence number and capture time, consumers wait on the condition
+        self.seq = 1 if self.ret else 0
+        self.timestamp = time.time()
+        self.cond = threading.Condition()
+        self.frames_captured = self.seq
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.consumers = {}     # consumer name -> delivered/dropped counts, for read_new(..., consumer=name)
+
+        # Optional ring of preallocated frames, the capture thread decodes into a free slot
+        # and never touches the newest slot or a slot that is still leased by a consumer
+        self.ring = None
+        self.ring_outputs = None
+        self.leases = None
+        self.slot = None
+        if ring_size is not None:
+            if ring_size < 2:
+                raise ValueError("ring_size must be >= 2")
+            if not self.ret:
+                raise RuntimeError("could not read a first frame to size the ring")
+            self.ring = [self.frame.copy() for _ in range(ring_size)]
+            self.ring_outputs = [{} for _ in range(ring_size)]
+            self.leases = [0] * ring_size
+            self.slot = 0
+            self.frame = self.ring[0]
+
+        if self.ret:
+            self.outputs = self._derive(self.frame, self.ring_outputs[0] if self.ring else None)
+
+        if self.mode == "unthrottled" and self.ret:
+            # The first frame goes through the queue too, so read_new() starts at seq 1
+            self.queue.append((self.frame, self.outputs, self.slot, 1, self.timestamp))
+            if self.ring is not None:
+                self.leases[self.slot] += 1
+            self.seq = 0
+
+        # With start=False nothing polls the device, the owner (e.g. a CameraGroup) calls grab/retrieve
         self.thread = threading.Thread(target=self.update, daemon=True)
-        self.thread.start()
+        if start:
+            self.thread.start()
 
     def update(self):
+        self.start_time = time.time()
         while self.running:
-            self.ret, self.frame = self.cap.read()
+            if self.mode == "realtime":
+                self._pace()
 
-    def read(self):
-        if self.ret:
-            return self.frame
+            grabbed = self.cap.grab()
+            self.position += 1
+            if not grabbed and self.mode is not None:
+                self._end()
+                break
+            self.retrieve(grabbed, time.time())
+
+    def _pace(self):
+        # Keep to the recorded frame rate, frames we are already late for are grabbed but not decoded
+        period = 1 / self.fps
+        while self.running:
+            lag = time.time() - (self.start_time + self.position * period)
+            if lag < 0:
+                time.sleep(-lag)
+                return
+            if lag < period or not self.cap.grab():
+                return
+            self.position += 1
+            with self.cond:
+                self.frames_skipped += 1
+
+    def _end(self):
+        with self.cond:
+            if self.mode == "realtime":
+                self.ret = False
+            self.ended = True
+            self.cond.notify_all()
+
+    def retrieve(self, grabbed, timestamp):
+        if not grabbed:
+            self._publish(False, None, None, None, timestamp)
+            return False
+
+        if self.ring is None:
+            slot = None
+            ret, image = self.cap.retrieve()
+        else:
+            slot = self._free_slot()
+            if slot is None:
+                # Every other slot is leased, skip this frame without decoding it
+                with self.cond:
+                    self.frames_skipped += 1
+                return False
+
+            ret, image = self.cap.retrieve(self.ring[slot])
+            if ret and image is not self.ring[slot]:
+                # OpenCV reallocated (e.g. the resolution changed), adopt the new buffer
+                self.ring[slot] = image
+
+        outputs = self._derive(image, self.ring_outputs[slot] if slot is not None else None) if ret else None
+        self._publish(ret, image, outputs, slot, timestamp)
+        return ret
+
+    def _derive(self, frame, buffers):
+        # With buffers (one dict per ring slot) every output is written into the same array each time
+        outputs = {"bgr": frame}
+        resized = {1.0: frame}
+        for spec, (code, scale) in self.output_specs.items():
+            image = resized.get(scale)
+            if image is None:
+                h, w = frame.shape[:2]
+                size = (max(1, round(w * scale)), max(1, round(h * scale)))
+                image = cv2.resize(frame, size, dst=self._buffer(buffers, scale), interpolation=cv2.INTER_AREA)
+                resized[scale] = self._keep(buffers, scale, image)
+
+            if code is not None:
+                image = cv2.cvtColor(image, code, dst=self._buffer(buffers, spec))
+                self._keep(buffers, spec, image)
+            outputs[spec] = image
+        return outputs
+
+    @staticmethod
+    def _buffer(buffers, key):
+        return None if buffers is None else buffers.get(key)
+
+    @staticmethod
+    def _keep(buffers, key, image):
+        if buffers is not None:
+            buffers[key] = image
+        return image
+
+    def _publish(self, ret, image, outputs, slot, timestamp):
+        with self.cond:
+            if ret and self.mode == "unthrottled":
+                # Hold the frame back until a consumer takes it, its ring slot stays leased meanwhile
+                self.cond.wait_for(lambda: len(self.queue) < self.readahead or not self.running)
+                self.frames_captured += 1
+                self.queue.append((image, outputs, slot, self.frames_captured, timestamp))
+                if slot is not None:
+                    self.leases[slot] += 1
+            else:
+                self.ret = ret
+                if ret:
+                    self.frames_captured += 1
+                    self._set_current(image, outputs, slot, self.seq + 1, timestamp)
+            self.cond.notify_all()
+
+    def _set_current(self, image, outputs, slot, seq, timestamp):
+        self.frame = image
+        self.outputs = outputs
+        self.slot = slot
+        self.seq = seq
+        self.timestamp = timestamp
+
+    def _free_slot(self):
+        with self.cond:
+            n = len(self.ring)
+            while True:
+                for i in range(1, n):
+                    slot = (self.slot + i) % n
+                    if self.leases[slot] == 0:
+                        return slot
+
+                # When every frame must be delivered, wait for a slot to come back instead of skipping
+                if self.mode != "unthrottled" or not self.running:
+                    return None
+                self.cond.wait()
+
+    def _release(self, slot):
+        with self.cond:
+            self.leases[slot] -= 1
+            self.cond.notify_all()
+
+    @staticmethod
+    def _readonly(image):
+        view = image.view()
+        view.flags.writeable = False
+        return view
+
+    def _current(self, output=None):
+        if output is None:
+            image = self.frame
+        elif isinstance(output, str):
+            image = self.outputs[output]
+        else:
+            return tuple(self._current(o) for o in output)
+
+        if self.ring is None:
+            return image
+        # Read-only view of the newest slot, it stays valid until the ring wraps around.
+        # Use lease() to pin the slot for longer.
+        return self._readonly(image)
+
+    def _wait_newer(self, after_seq, timeout, consumer=None):
+        # Caller holds self.cond
+        if self.mode == "unthrottled":
+            return self._take_queued(after_seq, timeout, consumer)
+
+        if not self.cond.wait_for(lambda: (self.ret and self.seq > after_seq) or not self.running or self.ended,
+                                  timeout):
+            return False
+        if not (self.ret and self.seq > after_seq):
+            return False
+
+        self._count(self.seq, after_seq, consumer)
+        return True
+
+    def _take_queued(self, after_seq, timeout, consumer=None):
+        # Caller holds self.cond, the next decoded frame becomes the current one
+        if not self.cond.wait_for(lambda: self.queue or not self.running or self.ended, timeout):
+            return False
+        if not self.queue:
+            return False
+
+        image, outputs, slot, seq, timestamp = self.queue.popleft()
+        self._set_current(image, outputs, slot, seq, timestamp)
+        if slot is not None:
+            self.leases[slot] -= 1
+        self.cond.notify_all()
+
+        self._count(seq, after_seq, consumer)
+        return True
+
+    def _count(self, seq, after_seq, consumer):
+        # Caller holds self.cond, frames between after_seq and seq were missed by this consumer
+        dropped = max(0, seq - after_seq - 1) if after_seq > 0 else 0
+        self.frames_delivered += 1
+        self.frames_dropped += dropped
+        if consumer is not None:
+            counts = self.consumers.setdefault(consumer, {"delivered": 0, "dropped": 0})
+            counts["delivered"] += 1
+            counts["dropped"] += dropped
+
+    def read(self, output=None):
+        with self.cond:
+            if self.mode == "unthrottled":
+                # Every frame is delivered: move on to the next decoded frame if there is one, without waiting
+                self._take_queued(self.seq, 0)
+            if self.ret and self.seq > 0:
+                return self._current(output)
+        return None
+
+    def read_new(self, after_seq=0, timeout=None, output=None, consumer=None):
+        # consumer: any hashable name, its own delivered/dropped counts show up in stats()["consumers"]
+        with self.cond:
+            if not self._wait_newer(after_seq, timeout, consumer):
+                return None
+            return self.seq, self.timestamp, self._current(output)
+
+    def lease(self):
+        with self.cond:
+            if not self.ret:
+                return FrameLease(None, None, None)
+            return self._lease()
+
+    def lease_new(self, after_seq=0, timeout=None, consumer=None):
+        with self.cond:
+            if not self._wait_newer(after_seq, timeout, consumer):
+                return FrameLease(None, None, None)
+            return self._lease()
+
+    def _lease(self):
+        outputs = {spec: self._current(spec) for spec in self.outputs}
+        if self.ring is None:
+            return FrameLease(None, None, self.frame, self.seq, self.timestamp, outputs)
+        self.leases[self.slot] += 1
+        return FrameLease(self, self.slot, self._current(), self.seq, self.timestamp, outputs)
+
+    def stats(self):
+        # delivered and dropped add up every consumer, per consumer counts need a consumer name in read_new()
+        with self.cond:
+            return {"captured": self.frames_captured,
+                    "delivered": self.frames_delivered,
+                    "dropped": self.frames_dropped,
+                    "skipped": self.frames_skipped,
+                    "consumers": {name: dict(counts) for name, counts in self.consumers.items()}}
 
     def stop(self):
-        self.running = False
-        self.thread.join()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
         self.cap.release()
 
 
 if __name__ == "__main__":
-    
-    cam = CameraStream(0)
+
+    # Pass a video file or image folder instead of 0 to replay a recording,
+    # e.g. CameraStream("recording.avi", mode="unthrottled") for a benchmark
+    cam = CameraStream(0, ring_size=4)
+    seq = 0
 
     while True:
-        frame = cam.read()
-        if frame is not None:
-            cv2.imshow("Camera Stream", frame)
+        lease = cam.lease_new(seq, timeout=1.0)
+        with lease as frame:
+            if frame is not None:
+                seq = lease.seq
+                cv2.imshow("Camera Stream", frame)
 
         if cv2.waitKey(1) & 0xFF == 27:
             break
 
+    print(cam.stats())
     cam.stop()
-    cv2.destroyAllWindows()
\ No newline at end of file
+    cv2.destroyAllWindows()
@@ -0,0 +1,195 @@
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from CameraStream import CameraStream
+
+# Layout of the shared memory block: one bus header, one header per slot, then the frame slots
+BUS_HEADER = np.dtype([("magic", "u4"), ("slots", "u4"), ("height", "u4"), ("width", "u4"),
+                       ("channels", "u4"), ("dtype", "S8"), ("latest", "u8")])
+SLOT_HEADER = np.dtype([("seq", "u8"), ("timestamp", "f8")])
+MAGIC = 0x46425553
+ALIGN = 64
+
+
+def _layout(slots, shape, dtype):
+    header_bytes = BUS_HEADER.itemsize + slots * SLOT_HEADER.itemsize
+    data_offset = (header_bytes + ALIGN - 1) // ALIGN * ALIGN
+    frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    frame_bytes = (frame_bytes + ALIGN - 1) // ALIGN * ALIGN
+    return data_offset, frame_bytes, data_offset + slots * frame_bytes
+
+
+def _views(buf, slots, shape, dtype):
+    data_offset, frame_bytes, _ = _layout(slots, shape, dtype)
+    header = np.ndarray((), BUS_HEADER, buffer=buf)
+    slot_headers = np.ndarray((slots,), SLOT_HEADER, buffer=buf, offset=BUS_HEADER.itemsize)
+    frames = [np.ndarray(shape, dtype, buffer=buf, offset=data_offset + i * frame_bytes) for i in range(slots)]
+    return header, slot_headers, frames
+
+
+class FramePublisher:
+
+    def __init__(self, name, shape, dtype=np.uint8, slots=4):
+        if slots < 2:
+            raise ValueError("slots must be >= 2")
+        shape = tuple(shape)
+        if len(shape) == 2:
+            shape = shape + (1,)
+
+        _, _, size = _layout(slots, shape, dtype)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.header, self.slot_headers, self.frames = _views(self.shm.buf, slots, shape, dtype)
+        self.shape = shape
+        self.slots = slots
+
+        self.slot_headers[:] = 0
+        self.header["slots"] = slots
+        self.header["height"], self.header["width"], self.header["channels"] = shape
+        self.header["dtype"] = np.dtype(dtype).str.encode("ascii")
+        self.header["latest"] = 0
+        self.header["magic"] = MAGIC
+
+        self.running = False
+        self.thread = None
+
+    def publish(self, seq, timestamp, frame):
+        if seq <= 0:
+            raise ValueError("seq must be > 0")
+
+        slot = seq % self.slots
+        header = self.slot_headers[slot]
+
+        # Mark the slot as being written so readers can detect a torn frame
+        header["seq"] = 0
+        np.copyto(self.frames[slot], frame.reshape(self.shape))
+        header["timestamp"] = timestamp
+        header["seq"] = seq
+        self.header["latest"] = seq
+
+    def attach(self, stream: CameraStream):
+        if self.thread is not None:
+            raise RuntimeError("publisher is already attached to a stream")
+
+        self.running = True
+        self.thread = threading.Thread(target=self.update, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def update(self, stream):
+        seq = 0
+        while self.running:
+            new = stream.read_new(seq, timeout=0.5, consumer="FrameBus")
+            if new is None:
+                continue
+            seq, timestamp, frame = new
+            self.publish(seq, timestamp, frame)
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        # Views must be released before the block can be closed
+        self.header = self.slot_headers = self.frames = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class FrameSubscriber:
+
+    def __init__(self, name):
+        # Attaching must not register the block with this process's resource tracker,
+        # otherwise it is unlinked when the subscriber exits
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        header = np.ndarray((), BUS_HEADER, buffer=self.shm.buf)
+        if header["magic"] != MAGIC:
+            raise ValueError(f"shared memory '{name}' is not a frame bus")
+
+        self.slots = int(header["slots"])
+        self.shape = (int(header["height"]), int(header["width"]), int(header["channels"]))
+        self.dtype = np.dtype(header["dtype"].item().decode("ascii"))
+        del header
+        self.header, self.slot_headers, self.frames = _views(self.shm.buf, self.slots, self.shape, self.dtype)
+
+    @property
+    def latest_seq(self):
+        return int(self.header["latest"])
+
+    def read(self):
+        # Returns (seq, timestamp, frame) as a read-only view into shared memory, without copying
+        while True:
+            seq = int(self.header["latest"])
+            if seq == 0:
+                return None
+
+            slot = seq % self.slots
+            timestamp = float(self.slot_headers[slot]["timestamp"])
+            if self.slot_headers[slot]["seq"] == seq:
+                view = self.frames[slot].view()
+                view.flags.writeable = False
+                return seq, timestamp, view
+
+    def read_new(self, after_seq=0, timeout=None, poll=0.001):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.header["latest"] <= after_seq:
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(poll)
+        return self.read()
+
+    def valid(self, seq):
+        # False once the publisher has started overwriting the slot of this frame
+        return self.slot_headers[seq % self.slots]["seq"] == seq
+
+    def close(self):
+        # Any frame views handed out must be dropped before closing
+        self.header = self.slot_headers = self.frames = None
+        self.shm.close()
+
+
+if __name__ == "__main__":
+
+    import sys
+    import cv2
+
+    if len(sys.argv) > 1:
+        # Subscriber: python FrameBus.py camera0 (run as many as needed, each in its own process)
+        name = sys.argv[1]
+        bus = FrameSubscriber(name)
+        seq = 0
+        while True:
+            new = bus.read_new(seq, timeout=1.0)
+            if new is None:
+                break
+            seq, timestamp, frame = new
+            cv2.imshow(f"Subscriber {name}", frame)
+            del frame, new
+            if cv2.waitKey(1) & 0xFF == 27:
+                break
+
+        bus.close()
+
+    else:
+        # Publisher: owns the camera and feeds the bus
+        cam = CameraStream(0)
+        first = cam.read()
+
+        bus = FramePublisher("camera0", first.shape, first.dtype, slots=4)
+        bus.attach(cam)
+        print("Publishing on 'camera0', start subscribers with: python FrameBus.py camera0")
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+        bus.close()
+        cam.stop()
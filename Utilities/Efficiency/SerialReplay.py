@@ -0,0 +1,184 @@
+import os
+import pty
+import select
+import struct
+import threading
+import time
+import tty
+
+# Recording format: a magic line, then per received line/chunk a (monotonic_ns, length) header and the raw bytes
+MAGIC = b"SERIALREC1\n"
+ENTRY = struct.Struct("<qI")
+
+
+class SerialRecorder:
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def record(self, data, timestamp_ns=None):
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        with self.lock:
+            self.file.write(ENTRY.pack(timestamp_ns, len(data)))
+            self.file.write(data)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(path):
+    # Yields (monotonic_ns, bytes) for every recorded entry
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a serial recording")
+        while len(header := file.read(ENTRY.size)) == ENTRY.size:
+            timestamp_ns, length = ENTRY.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            yield timestamp_ns, data
+
+
+class SerialReplayer:
+
+    # Stand-in device: replays a recording on a pseudo-terminal, open self.port with SerialStream (POSIX only).
+    # realtime=True keeps the recorded timing (scaled by speed), realtime=False sends as fast as the reader takes it.
+
+    def __init__(self, path, realtime=True, speed=1.0, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        # Non-blocking so a reader that stops never hangs the replayer, close() drops pending output
+        os.set_blocking(self.master, False)
+
+        self.received = bytearray()     # Whatever the program under test wrote to the device
+        self.sent = 0
+        self.sent_bytes = 0
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+        self.running = True
+        self.thread = threading.Thread(target=self.update, daemon=True)
+        self.thread.start()
+
+    def update(self):
+        self.started = time.monotonic()
+        while self.running:
+            first = None
+            for timestamp_ns, data in read_recording(self.path):
+                if first is None:
+                    first = timestamp_ns
+                    start = time.monotonic_ns()
+                if self.realtime:
+                    due = start + (timestamp_ns - first) / self.speed
+                    self._drain_until(due)
+                if not self._write(data):
+                    break
+                self.sent += 1
+                self.sent_bytes += len(data)
+
+            if not self.loop:
+                break
+
+        self.finished = time.monotonic()
+        self.done.set()
+        # Keep draining writes until closed, the port stays usable after the recording ends
+        while self.running:
+            self._drain_until(time.monotonic_ns() + 100_000_000)
+
+    def _drain_until(self, due_ns):
+        # Sleeps until due_ns while collecting bytes written by the program under test
+        while self.running:
+            remaining = (due_ns - time.monotonic_ns()) / 1e9
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self.master], [], [], remaining)
+            if readable and not self._read():
+                return
+
+    def _read(self):
+        # Collects bytes written by the program under test, False once the pty is gone
+        try:
+            self.received += os.read(self.master, 4096)
+        except BlockingIOError:
+            pass
+        except OSError:
+            return False
+        return True
+
+    def _write(self, data):
+        # Waits for room in the pty buffer while still draining the other direction, False when closed first
+        data = memoryview(data)
+        while data:
+            if not self.running:
+                return False
+            readable, writable, _ = select.select([self.master], [self.master], [], 0.1)
+            if readable and not self._read():
+                return False
+            if writable:
+                try:
+                    data = data[os.write(self.master, data):]
+                except BlockingIOError:
+                    pass
+        return True
+
+    def stats(self):
+        elapsed = (self.finished or time.monotonic()) - self.started if self.started else 0.0
+        return {"sent": self.sent,
+                "bytes": self.sent_bytes,
+                "elapsed": elapsed,
+                "rate": self.sent / elapsed if elapsed > 0 else 0.0}
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+if __name__ == "__main__":
+
+    import sys
+    from SerialStream import SerialStream
+
+    if len(sys.argv) == 4 and sys.argv[1] == "record":
+        # python SerialReplay.py record /dev/ttyUSB0 session.rec
+        recorder = SerialRecorder(sys.argv[3])
+        ser = SerialStream(port=sys.argv[2], baudrate=9600, recorder=recorder)
+        print(f"Recording {sys.argv[2]} to {sys.argv[3]}, Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+                print(f"{recorder.count} entries")
+        except KeyboardInterrupt:
+            pass
+        ser.stop()
+        recorder.close()
+
+    elif len(sys.argv) == 3 and sys.argv[1] == "replay":
+        # python SerialReplay.py replay session.rec, SerialStream runs unchanged on the pty
+        replayer = SerialReplayer(sys.argv[2], realtime=True)
+        ser = SerialStream(port=replayer.port, baudrate=9600)
+        while not replayer.done.wait(1):
+            print(f"Latest: {ser.read()}")
+        print(replayer.stats())
+        ser.stop()
+        replayer.close()
+
+    else:
+        print("usage: SerialReplay.py record <port> <file> | replay <file>")
@@ -1,17 +1,283 @@
 import serial
 import threading
 import time
+import re
+import struct
+import itertools
+import numpy as np
 from collections import deque
 
 
+class LineParser:
+
+    # Base for parsers that turn one received record into typed fields, stored next to a timestamp_ns column
+    binary = False
+
+    def __init__(self, fields):
+        self.fields = [(name, np.dtype(dtype)) for name, dtype in fields]
+        self.dtype = np.dtype([("timestamp_ns", "i8")] + self.fields)
+        self.converters = [float if dtype.kind == "f" else int if dtype.kind in "iub" else bytes
+                           for _, dtype in self.fields]
+
+    def convert(self, values):
+        if len(values) != len(self.converters):
+            return None
+        try:
+            return tuple(convert(value) for convert, value in zip(self.converters, values))
+        except (TypeError, ValueError):
+            # Malformed fields, or None from an optional regex group that did not match
+            return None
+
+
+class RegexParser(LineParser):
+
+    def __init__(self, pattern, fields):
+        super().__init__(fields)
+        self.pattern = re.compile(pattern.encode("ascii") if isinstance(pattern, str) else pattern)
+
+    def parse(self, line):
+        match = self.pattern.search(line)
+        return self.convert(match.groups()) if match else None
+
+
+class CsvParser(LineParser):
+
+    def __init__(self, fields, delimiter=","):
+        super().__init__(fields)
+        self.delimiter = delimiter.encode("ascii")
+
+    def parse(self, line):
+        return self.convert(line.strip().split(self.delimiter))
+
+
+class StructParser(LineParser):
+
+    # Fixed size binary records, optionally preceded by a header used to resynchronise
+    binary = True
+
+    def __init__(self, fmt, fields, header=b""):
+        super().__init__(fields)
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.header = header
+
+    def parse(self, record):
+        if len(record) != self.size:
+            return None
+        return self.struct.unpack(record)
+
+
+class SampleRing:
+
+    # Preallocated structured array used as a ring, the newest rows can be read without touching older data
+    def __init__(self, dtype, capacity):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, row):
+        with self.lock:
+            self.data[self.count % self.capacity] = row
+            self.count += 1
+
+    def last(self, n, copy=True):
+        # A view is only handed out when the rows are contiguous and copy=False, it is overwritten as the ring wraps
+        with self.lock:
+            n = min(n, self.count, self.capacity)
+            if n <= 0:
+                return self.data[:0].copy()
+            end = (self.count - 1) % self.capacity + 1
+            start = end - n
+            if start >= 0:
+                rows = self.data[start:end]
+                return rows.copy() if copy else rows
+            return np.concatenate((self.data[start:], self.data[:end]))
+
+
+class PendingMessage:
+
+    # Handle returned by SerialWriter.send, status: queued, sent (awaiting its ack if it has one),
+    # acked, coalesced, dropped, timeout or error (response is then the exception or reason)
+    def __init__(self, data, key=None, ack=None):
+        self.data = data
+        self.key = key
+        self.ack = re.compile(ack) if isinstance(ack, str) else ack
+        self.status = "queued"
+        self.response = None
+        self.sent_ns = None
+        self.acked_ns = None
+        self._done = threading.Event()
+
+    def matches(self, line):
+        if callable(self.ack):
+            return self.ack(line)
+        if hasattr(self.ack, "search"):
+            return self.ack.search(line) is not None
+        return True
+
+    @property
+    def latency_ms(self):
+        # Send-to-ack latency
+        if self.sent_ns is None or self.acked_ns is None:
+            return None
+        return (self.acked_ns - self.sent_ns) / 1e6
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.response
+
+    def _finish(self, status, response=None):
+        self.status = status
+        self.response = response
+        self._done.set()
+
+
+class SerialWriter:
+
+    # Writes on a background thread so the caller never blocks on the port.
+    # Messages sent with the same key coalesce while queued: only the newest is written (latest wins).
+    # Messages with an ack are matched to a received line, either fed by a reader thread through feed()
+    # or read here with read_line after the write.
+
+    def __init__(self, ser, maxsize=32, ack_timeout=1.0, read_line=None, on_unmatched=None):
+        self.ser = ser
+        self.maxsize = maxsize
+        self.ack_timeout_ns = int(ack_timeout * 1e9)
+        self.read_line = read_line
+        self.on_unmatched = on_unmatched
+
+        self.queue = deque()
+        self.awaiting = deque()
+        self.cond = threading.Condition()
+        self.latencies = deque(maxlen=256)
+        self.counts = {"sent": 0, "acked": 0, "coalesced": 0, "dropped": 0, "timeout": 0, "error": 0}
+
+        self.running = True
+        self.thread = threading.Thread(target=self.update, daemon=True)
+        self.thread.start()
+
+    def send(self, data, key=None, ack=None):
+        message = PendingMessage(data, key, ack)
+        with self.cond:
+            if not self.ser.is_open:
+                self._finish(message, "error", "port closed")
+                return message
+            replaced = None
+            if key is not None:
+                for i, queued in enumerate(self.queue):
+                    if queued.key == key:
+                        replaced, self.queue[i] = queued, message
+                        break
+            if replaced is not None:
+                self._finish(replaced, "coalesced")
+            else:
+                self.queue.append(message)
+                if len(self.queue) > self.maxsize:
+                    self._finish(self.queue.popleft(), "dropped")
+            self.cond.notify_all()
+        return message
+
+    def _finish(self, message, status, response=None):
+        self.counts[status] += 1
+        if status == "acked":
+            self.latencies.append(message.latency_ms)
+        message._finish(status, response)
+
+    def feed(self, line):
+        # Offer a received line to the oldest message waiting for an ack, returns True if it matched
+        now = time.monotonic_ns()
+        with self.cond:
+            self._expire(now)
+            for message in self.awaiting:
+                if message.matches(line):
+                    self.awaiting.remove(message)
+                    message.acked_ns = now
+                    self._finish(message, "acked", line)
+                    return True
+        return False
+
+    def _expire(self, now):
+        # Caller holds self.cond
+        while self.awaiting and now - self.awaiting[0].sent_ns > self.ack_timeout_ns:
+            self._finish(self.awaiting.popleft(), "timeout")
+
+    def update(self):
+        while self.running:
+            with self.cond:
+                # Wake up now and then while acks are outstanding so unanswered messages time out
+                self.cond.wait_for(lambda: self.queue or not self.running, 0.05 if self.awaiting else None)
+                self._expire(time.monotonic_ns())
+                if not self.running:
+                    break
+                if not self.queue:
+                    continue
+                message = self.queue.popleft()
+
+                # Wait for the ack before writing, a reader thread may see the response before write() returns
+                message.status = "sent"
+                message.sent_ns = time.monotonic_ns()
+                self.counts["sent"] += 1
+                if message.ack is not None:
+                    self.awaiting.append(message)
+
+            try:
+                self.ser.write(message.data)
+                if message.ack is None:
+                    message._finish("sent")
+                elif self.read_line is not None:
+                    self._read_ack(message)
+            except (serial.SerialException, OSError) as error:
+                # Only this message fails, the writer keeps serving the queue
+                with self.cond:
+                    if message in self.awaiting:
+                        self.awaiting.remove(message)
+                    if not message._done.is_set():
+                        self._finish(message, "error", error)
+
+    def _read_ack(self, message):
+        while not message._done.is_set():
+            line = self.read_line()
+            if line and not self.feed(line) and self.on_unmatched is not None:
+                self.on_unmatched(line)
+            with self.cond:
+                self._expire(time.monotonic_ns())
+
+    def stats(self):
+        with self.cond:
+            stats = dict(self.counts)
+            latencies = sorted(self.latencies)
+        stats["queued"] = len(self.queue)
+        stats["latency_ms_p50"] = latencies[len(latencies) // 2] if latencies else None
+        stats["latency_ms_max"] = latencies[-1] if latencies else None
+        return stats
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+
+
 class SerialStream:
 
-    def __init__(self, port, baudrate=9600, timeout=0.5, buffer_size=100):
+    def __init__(self, port, baudrate=9600, timeout=0.5, buffer_size=100, parser=None, write_queue=None,
+                 recorder=None):
         self.ser = serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
 
+        # Everything received is logged with its monotonic time, see SerialReplay.SerialRecorder
+        self.recorder = recorder
+
+        # With a write queue, write() returns immediately and a background thread does the writing
+        self.writer = SerialWriter(self.ser, maxsize=write_queue) if write_queue else None
+
         self.buffer = deque(maxlen=buffer_size)
         self.latest = None
 
+        # With a parser every record is stored as a typed row in a numpy ring instead of a string
+        self.parser = parser
+        self.samples = SampleRing(parser.dtype, buffer_size) if parser is not None else None
+
         self.running = True
         self.thread = threading.Thread(target=self.update, daemon=True)
         self.thread.start()
@@ -20,27 +286,71 @@ class SerialStream:
     def update(self):
         while self.running:
 
+            if self.parser is not None:
+                self._update_parsed()
+                continue
+
             line = self.ser.readline()
             if not line:
                 continue
+            if self.recorder is not None:
+                self.recorder.record(line)
 
             self.latest = line.decode('utf-8', errors='ignore').strip()
             self.buffer.append({time.time_ns(): self.latest})
+            if self.writer is not None and self.writer.awaiting:
+                self.writer.feed(self.latest)
+
+    def _update_parsed(self):
+        if self.parser.binary:
+            if self.parser.header:
+                skipped = self.ser.read_until(self.parser.header)
+                if self.recorder is not None and skipped:
+                    self.recorder.record(skipped)
+                if not skipped.endswith(self.parser.header):
+                    return
+            record = self.ser.read(self.parser.size)
+        else:
+            record = self.ser.readline()
+        if not record:
+            return
+        if self.recorder is not None:
+            self.recorder.record(record)
+
+        if self.writer is not None and self.writer.awaiting and not self.parser.binary:
+            self.writer.feed(record.decode('utf-8', errors='ignore').strip())
+
+        values = self.parser.parse(record)
+        if values is not None:
+            self.samples.append((time.time_ns(),) + values)
 
 
-    def write(self, message):
-        self.ser.write(f'[PY] {message}\n'.encode('ascii'))
+    def write(self, message, key=None, ack=None):
+        # With a write queue: key coalesces setpoints (latest wins), ack (regex or callable) waits for a response.
+        # Returns a PendingMessage then, see its status, wait() and latency_ms.
+        data = f'[PY] {message}\n'.encode('ascii')
+        if self.writer is not None:
+            return self.writer.send(data, key=key, ack=ack)
+        self.ser.write(data)
 
     def read(self, n_latest=None):
+        if self.parser is not None:
+            if n_latest is None:
+                latest = self.samples.last(1)
+                return latest[0] if len(latest) else None
+            return self.samples.last(n_latest)
+
         if n_latest is None:
             return self.latest
 
         n_latest = min(n_latest, len(self.buffer))
-        return list(self.buffer)[-n_latest:]
+        return list(itertools.islice(reversed(self.buffer), n_latest))[::-1]
 
     def stop(self):
         self.running = False
         self.thread.join()
+        if self.writer is not None:
+            self.writer.stop()
         self.ser.close()
 
 
@@ -48,6 +358,10 @@ if __name__ == "__main__":
 
     ser = SerialStream(port='/dev/ttyUSB0', baudrate=9600, timeout=0.5, buffer_size=100)
 
+    # For numeric data pass a parser, e.g. lines like "12,0.53"
+    # ser = SerialStream(port='/dev/ttyUSB0', parser=CsvParser([("height", "i4"), ("pwm", "f4")]))
+    # ser.read(5)["height"] is then a numpy array with the last 5 heights
+
     try:
         while True:
             latest = ser.read()
@@ -55,10 +369,10 @@ if __name__ == "__main__":
 
             latest_5 = ser.read(n_latest=5)
             print(f"Latest 5: {latest_5}")
-            
+
             ser.write("Hello from Python!")
 
             time.sleep(1)
-            
+
     finally:
-        ser.stop()
\ No newline at end of file
+        ser.stop()
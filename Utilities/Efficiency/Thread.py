@@ -2,47 +2,284 @@ import threading
 import queue
 import functools
 import time
+import asyncio
+import inspect
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
 from collections import deque
+import numpy as np
 import cv2
 
 class BoundedBuffer:
 
-    def __init__(self, maxlen=128, lifo=False):
+    def __init__(self, maxlen=128, lifo=False, cond=None):
         if maxlen <= 0:
             raise ValueError("buffer_size must be > 0")
-        self._dq = deque(maxlen=maxlen)
-        self._lock = threading.Lock()
+        self._dq = deque(maxlen=maxlen)     # (put time, item) pairs
+        # Buffers may share a condition so one consumer can wait on several of them
+        self._lock = cond if cond is not None else threading.Condition()
         self._lifo = lifo
+        self._seq = 0       # Number of items ever put, lets consumers wait for something newer
+        self._dropped = 0   # Items pushed out by the deque before anyone read them
+        self._peak = 0
 
     def put(self, item):
         with self._lock:
-            self._dq.append(item)
+            if len(self._dq) == self._dq.maxlen:
+                self._dropped += 1
+            self._dq.append((time.monotonic(), item))
+            self._peak = max(self._peak, len(self._dq))
+            self._seq += 1
+            self._lock.notify_all()
 
     def empty(self):
         with self._lock:
             return len(self._dq) == 0
 
+    @property
+    def seq(self):
+        return self._seq
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._dq), "capacity": self._dq.maxlen, "peak": self._peak, "dropped": self._dropped}
+
+    def _wait(self, predicate, block, timeout):
+        # Caller holds self._lock
+        if not block:
+            return predicate()
+        return self._lock.wait_for(predicate, timeout)
+
     def get_nowait(self):
+        return self.get(block=False)
+
+    def get(self, block=True, timeout=None, stamped=False):
+        # stamped=True returns (put time, item) with the time from time.monotonic()
+        with self._lock:
+            if not self._wait(lambda: len(self._dq) > 0, block, timeout):
+                raise queue.Empty
+            entry = self._dq.pop() if self._lifo else self._dq.popleft()
+            return entry if stamped else entry[1]
+
+    def take_latest(self, block=True, timeout=None, stamped=False):
+        # Newest item, everything older is discarded by swapping in an empty deque
         with self._lock:
-            if not self._dq:
+            if not self._wait(lambda: len(self._dq) > 0, block, timeout):
                 raise queue.Empty
-            return self._dq.pop() if self._lifo else self._dq.popleft()
+            entry = self._dq[-1]
+            self._dq = deque(maxlen=self._dq.maxlen)
+            return entry if stamped else entry[1]
 
-    def get(self):
-        return self.get_nowait()
+    def wait_newer_than(self, seq, timeout=None):
+        # Blocks until an item newer than seq was put, returns (seq, newest item) without removing it
+        with self._lock:
+            if not self._lock.wait_for(lambda: self._seq > seq and len(self._dq) > 0, timeout):
+                return None
+            return self._seq, self._dq[-1][1]
 
-    def drain(self):
+    def drain(self, stamped=False):
         with self._lock:
-            items = list(self._dq)
+            entries = list(self._dq)
             self._dq.clear()
-            return items
+            return entries if stamped else [item for _, item in entries]
+
+
+class TaskMetrics:
+    # Execution times and result ages over the last window runs/reads, percentiles are computed on snapshot
+
+    def __init__(self, window=512):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.durations = deque(maxlen=window)
+        self.ages = deque(maxlen=window)
+
+    def record_run(self, duration=None, count=True):
+        with self._lock:
+            if count:
+                self.runs += 1
+            if duration is not None:
+                self.durations.append(duration)
+
+    def record_age(self, age):
+        with self._lock:
+            self.ages.append(age)
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {"p50": None, "p95": None, "p99": None}
+        p50, p95, p99 = np.percentile(np.fromiter(samples, float, len(samples)) * 1000, [50, 95, 99])
+        return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+    def snapshot(self):
+        with self._lock:
+            runs = self.runs
+            durations = list(self.durations)
+            ages = list(self.ages)
+        return {"runs": runs, "exec_ms": self._percentiles(durations), "age_ms": self._percentiles(ages)}
+
+
+class TaskSchedule:
+    # Paces a task loop: an optional target rate in Hz and an exponential idle backoff while it returns None
+
+    MIN_BACKOFF = 0.001
+
+    def __init__(self, rate=None, backoff=None, stats=None):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.period = 1.0 / rate if rate else None
+        self.max_backoff = backoff
+        self.idle = 0.0
+        self.next_start = None
+        self.starts = deque(maxlen=32)
+        # stats[0] is the achieved rate, stats[1] the deadline misses (a shared array for process tasks)
+        self.stats = stats if stats is not None else [0.0, 0.0]
+
+    def delay(self):
+        now = time.monotonic()
+        if self.next_start is None:
+            self.next_start = now
+        wait = max(self.next_start - now, self.idle) if self.period else self.idle
+        return max(wait, 0.0)
+
+    def begin(self):
+        self.starts.append(time.monotonic())
+        if len(self.starts) > 1:
+            self.stats[0] = (len(self.starts) - 1) / max(self.starts[-1] - self.starts[0], 1e-9)
+
+    def done(self, result):
+        if self.max_backoff:
+            self.idle = 0.0 if result is not None else min(max(self.idle * 2, self.MIN_BACKOFF), self.max_backoff)
+
+        if self.period:
+            now = time.monotonic()
+            self.next_start += self.period
+            if now > self.next_start:
+                # Finished after the next tick was due, skip the missed ticks instead of bursting
+                self.stats[1] += 1
+                self.next_start = now
+
+
+class SharedArray:
+    # Placeholder for an ndarray result that travels through a shared memory block instead of a pipe
+    def __init__(self, slot, name, shape, dtype):
+        self.slot = slot
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _pack(obj, blocks, free, min_bytes, stop):
+    if isinstance(obj, np.ndarray) and obj.nbytes >= min_bytes:
+        # Wait for the parent to hand a block back, it does so as soon as it has copied the data out
+        while True:
+            try:
+                slot = free.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop.is_set():
+                    return None
+
+        shm = blocks.get(slot)
+        if shm is None or shm.size < obj.nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = blocks[slot] = shared_memory.SharedMemory(create=True, size=obj.nbytes)
+        np.ndarray(obj.shape, obj.dtype, buffer=shm.buf)[...] = obj
+        return SharedArray(slot, shm.name, obj.shape, obj.dtype.str)
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(_pack(o, blocks, free, min_bytes, stop) for o in obj)
+    if isinstance(obj, dict):
+        return {k: _pack(v, blocks, free, min_bytes, stop) for k, v in obj.items()}
+    return obj
+
+
+def _unpack(obj, handles, free):
+    if isinstance(obj, SharedArray):
+        shm = handles.get(obj.slot)
+        if shm is None or shm.name != obj.name:
+            # The worker replaced the block with a larger one
+            if shm is not None:
+                shm.close()
+            shm = handles[obj.slot] = shared_memory.SharedMemory(name=obj.name)
+        result = np.ndarray(obj.shape, obj.dtype, buffer=shm.buf).copy()
+        free.put(obj.slot)
+        return result
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(_unpack(o, handles, free) for o in obj)
+    if isinstance(obj, dict):
+        return {k: _unpack(v, handles, free) for k, v in obj.items()}
+    return obj
+
+
+def _process_worker(task, results, free, runs, stop, min_bytes, schedule):
+    # Runs in the worker process, task must be picklable (a module level function on Windows/macOS)
+    blocks = {}
+    try:
+        while not stop.is_set():
+            if stop.wait(schedule.delay()):
+                break
+            schedule.begin()
+            start = time.perf_counter()
+            result = task()
+            duration = time.perf_counter() - start
+            schedule.done(result)
+            with runs.get_lock():
+                runs.value += 1
+            if result is not None:
+                results.put((time.time(), duration, _pack(result, blocks, free, min_bytes, stop)))
+    finally:
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+
+
+def _resolve(future, result):
+    # Runs on the waiter's event loop
+    if not future.done():
+        future.set_result(result)
+
+
+def _fail(future, error):
+    # Runs on the waiter's event loop
+    if not future.done():
+        future.set_exception(error)
+
+
+def _offer(results, result):
+    # Runs on the subscriber's event loop, a full queue drops its oldest result
+    if results.full():
+        results.get_nowait()
+    results.put_nowait(result)
+
+
+_STOPPED = object()     # Offered to every results() subscriber on stop(), ends the iteration
+
 
 class ThreadManager:
-    def __init__(self, tasks=None, keep_timestamp=False, lifo=True, buffer_size=128):
+    def __init__(self, tasks=None, keep_timestamp=False, lifo=True, buffer_size=128, shared_slots=4,
+                 shared_min_bytes=65536):
         self.queues = {}
         self.latest_results = {}
-        self.runs = {}
+        self.metrics = {}
         self.threads = []
+        self.processes = []
+        self.shared_runs = {}
+        self.edges = {}
+        self.schedules = {}
+        self.wakeup = threading.Event()
+        self.coroutines = []
+        self.loop = None                # Event loop thread for coroutine tasks, created on start()
+        self.loop_thread = None
+        self.loop_futures = []
+        self.async_lock = threading.Lock()
+        self.async_waiters = {}         # name -> [(loop, future)] for next()
+        self.async_subscribers = {}     # name -> [(loop, asyncio.Queue)] for results()
+        self.stop_event = multiprocessing.Event()
+        self.shared_slots = shared_slots            # Shared memory blocks per process task
+        self.shared_min_bytes = shared_min_bytes    # Smaller arrays are simply pickled
         self.running = True
         self.keep_timestamp = keep_timestamp
         self.lifo = lifo
@@ -58,28 +295,184 @@ class ThreadManager:
     def keep_timestamps(self, keep_timestamp):
         self.keep_timestamp = keep_timestamp
 
+    def _store(self, name, result, stamp=None):
+        # Non-blocking put; buffer drops oldest if full
+        result = {"fresh": True, "result": result}
+        if self.keep_timestamp:
+            result["time"] = time.time() if stamp is None else stamp
+        self.queues[name].put(result)
+
+        # Feed downstream tasks, every edge has its own buffer so they never steal from latest()/all()
+        for edge in self.edges[name]:
+            edge.put(result["result"])
+
+        # Wake asyncio consumers on their own loops
+        if self.async_waiters[name] or self.async_subscribers[name]:
+            with self.async_lock:
+                waiters, self.async_waiters[name] = self.async_waiters[name], []
+                subscribers = list(self.async_subscribers[name])
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(_resolve, future, dict(result))
+            for loop, results in subscribers:
+                loop.call_soon_threadsafe(_offer, results, dict(result))
+
+    def _sleep(self, delay):
+        # Returns early when the manager stops
+        if delay > 0:
+            self.wakeup.wait(delay)
+
     def _run_task(self, name, task):
+        schedule = self.schedules[name]
         while self.running:
+            self._sleep(schedule.delay())
+            if not self.running:
+                break
+
+            schedule.begin()
+            start = time.perf_counter()
             result = task()
-            self.runs[name] += 1
+            self.metrics[name].record_run(time.perf_counter() - start)
+            schedule.done(result)
+            if result is not None:
+                self._store(name, result)
+
+    def _run_dataflow_task(self, name, task, inputs, inbox):
+        schedule = self.schedules[name]
+        values = [[] if mode == "all" else None for _, mode in inputs]
+        received = [False] * len(inputs)
+        while self.running:
+            self._sleep(schedule.delay())
+
+            # Sleep until any upstream task produced something new
+            with inbox:
+                inbox.wait_for(lambda: not self.running or not all(edge.empty() for edge, _ in inputs), timeout=0.1)
+
+                fresh = False
+                for i, (edge, mode) in enumerate(inputs):
+                    items = edge.drain()
+                    if mode == "all":
+                        values[i] = items
+                    elif items:
+                        values[i] = items[-1]
+                    fresh |= len(items) > 0
+                    received[i] |= len(items) > 0
+
+            # Every input needs a first value before the task can run
+            if not fresh or not all(received):
+                continue
+
+            schedule.begin()
+            start = time.perf_counter()
+            result = task(*values)
+            self.metrics[name].record_run(time.perf_counter() - start)
+            schedule.done(result)
+            if result is not None:
+                self._store(name, result)
+
+    async def _run_coroutine_task(self, name, func, args, kwargs):
+        schedule = self.schedules[name]
+        while self.running:
+            delay = schedule.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            schedule.begin()
+            start = time.perf_counter()
+            result = await func(*args, **kwargs)
+            self.metrics[name].record_run(time.perf_counter() - start)
+            schedule.done(result)
             if result is not None:
-                # Non-blocking put; buffer drops oldest if full
-                result = {"fresh": True, "result": result}
-                if self.keep_timestamp:
-                    result["time"] = time.time()
-                self.queues[name].put(result)
+                self._store(name, result)
+
+    def _connect(self, inputs, buffer_size):
+        # inputs: func, (func, "latest" | "all") or a list of those
+        if callable(inputs) or isinstance(inputs, tuple):
+            inputs = [inputs]
+
+        inbox = threading.Condition()
+        edges = []
+        for spec in inputs:
+            upstream, mode = spec if isinstance(spec, tuple) else (spec, "latest")
+            if mode not in ("latest", "all"):
+                raise ValueError(f"input mode must be 'latest' or 'all', got {mode}")
+            if upstream.__name__ not in self.queues:
+                raise Exception(f"Function {upstream.__name__} is not registered, register inputs first.")
+
+            edge = BoundedBuffer(maxlen=1 if mode == "latest" else buffer_size, cond=inbox)
+            self.edges[upstream.__name__].append(edge)
+            edges.append((edge, mode))
+        return edges, inbox
+
+    def _collect_process(self, name, results, free):
+        handles = {}
+        try:
+            while self.running:
+                try:
+                    stamp, duration, packed = results.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                # Runs are counted by the worker, only runs with a result report their duration
+                self.metrics[name].record_run(duration, count=False)
+                self._store(name, _unpack(packed, handles, free), stamp)
+        finally:
+            for shm in handles.values():
+                shm.close()
+
+    def register_task(self, func, *args, buffer_size=None, executor="thread", inputs=None, rate=None, backoff=None,
+                      **kwargs):
+        # Scheduling: rate caps the task at a target frequency in Hz, backoff (s) is the longest idle sleep
+        # after consecutive None results, and inputs makes the task run only on new upstream results
+        if executor not in ("thread", "process"):
+            raise ValueError(f"executor must be 'thread' or 'process', got {executor}")
+        if inputs is not None and executor != "thread":
+            raise ValueError("tasks with inputs can only run on the thread executor")
+        if inspect.iscoroutinefunction(func) and (inputs is not None or executor != "thread"):
+            raise ValueError("coroutine tasks run on the manager's event loop and cannot take inputs")
 
-    def register_task(self, func, *args, buffer_size=None, **kwargs):
         name = func.__name__
         bsize = buffer_size if buffer_size is not None else self.default_buffer_size
         self.queues[name] = BoundedBuffer(maxlen=bsize, lifo=self.lifo)
         self.latest_results[name] = {"fresh": False, "result": None}
         if self.keep_timestamp:
             self.latest_results[name]["time"] = time.time()
-        self.runs[name] = 0
+        self.metrics[name] = TaskMetrics()
+        self.edges[name] = []
+        self.async_waiters[name] = []
+        self.async_subscribers[name] = []
+        stats = multiprocessing.Array("d", 2) if executor == "process" else None
+        self.schedules[name] = TaskSchedule(rate, backoff, stats)
+
+        if inspect.iscoroutinefunction(func):
+            # Coroutine tasks share one event loop thread next to the thread tasks
+            self.coroutines.append((name, func, args, kwargs))
+            return
+
+        if inputs is not None:
+            # The newest upstream results are passed in front of the fixed args: func(*inputs, *args, **kwargs)
+            edges, inbox = self._connect(inputs, bsize)
+            task = lambda *values: func(*values, *args, **kwargs)
+            thread = threading.Thread(target=self._run_dataflow_task, args=(name, task, edges, inbox), daemon=True)
+            self.threads.append(thread)
+            return
 
         task = functools.partial(func, *args, **kwargs)
-        thread = threading.Thread(target=self._run_task, args=(name, task), daemon=True)
+        if executor == "thread":
+            thread = threading.Thread(target=self._run_task, args=(name, task), daemon=True)
+            self.threads.append(thread)
+            return
+
+        # The task loops in its own process, a collector thread moves its results into the buffer
+        results = multiprocessing.Queue(maxsize=bsize)
+        free = multiprocessing.Queue()
+        for slot in range(self.shared_slots):
+            free.put(slot)
+        self.shared_runs[name] = multiprocessing.Value("Q", 0)
+
+        process = multiprocessing.Process(target=_process_worker, daemon=True,
+                                          args=(task, results, free, self.shared_runs[name], self.stop_event,
+                                                self.shared_min_bytes, self.schedules[name]))
+        self.processes.append(process)
+        thread = threading.Thread(target=self._collect_process, args=(name, results, free), daemon=True)
         self.threads.append(thread)
 
     def print_registered_functions(self):
@@ -92,14 +485,25 @@ class ThreadManager:
         name = func.__name__
         if name not in self.queues:
             raise Exception(f"Function {name} is not registered. Use print_registered_functions().")
-        return self.queues[name].drain()
-
-    def latest(self, func):
+        now = time.monotonic()
+        entries = self.queues[name].drain(stamped=True)
+        for stamp, _ in entries:
+            self.metrics[name].record_age(now - stamp)
+        return [result for _, result in entries]
+
+    def latest(self, func, timeout=None):
+        # With a timeout, wait up to timeout seconds for a fresh result
         name = func.__name__
         if name not in self.queues:
             raise Exception(f"Function {name} is not registered. Use print_registered_functions().")
         try:
-            result = self.queues[name].get_nowait()
+            buffer = self.queues[name]
+            block = timeout is not None
+            if self.lifo:
+                stamp, result = buffer.take_latest(block=block, timeout=timeout, stamped=True)
+            else:
+                stamp, result = buffer.get(block=block, timeout=timeout, stamped=True)
+            self.metrics[name].record_age(time.monotonic() - stamp)
             self.latest_results[name] = result
             return result
         except queue.Empty:
@@ -107,18 +511,155 @@ class ThreadManager:
             result["fresh"] = False
             return result
 
+    async def next(self, func, timeout=None):
+        # Waits for the next result of func without polling, call from any event loop
+        name = func.__name__
+        if name not in self.queues:
+            raise Exception(f"Function {name} is not registered. Use print_registered_functions().")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (asyncio.get_running_loop(), future)
+        with self.async_lock:
+            if not self.running:
+                raise RuntimeError("ThreadManager is stopped")
+            self.async_waiters[name].append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            with self.async_lock:
+                if waiter in self.async_waiters[name]:
+                    self.async_waiters[name].remove(waiter)
+
+    async def results(self, func, maxsize=16):
+        # Async iterator over every result of func, keeps up to maxsize results if the consumer falls behind
+        name = func.__name__
+        if name not in self.queues:
+            raise Exception(f"Function {name} is not registered. Use print_registered_functions().")
+
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=maxsize))
+        with self.async_lock:
+            self.async_subscribers[name].append(subscriber)
+        try:
+            while self.running:
+                result = await subscriber[1].get()
+                if result is _STOPPED:
+                    return
+                yield result
+        finally:
+            with self.async_lock:
+                self.async_subscribers[name].remove(subscriber)
+
     def get_number_of_runs(self, func):
         name = func.__name__
         if name not in self.queues:
             raise Exception(f"Function {name} is not registered.")
-        return self.runs[name]
+        if name in self.shared_runs:
+            return self.shared_runs[name].value
+        return self.metrics[name].runs
+
+    def get_schedule_stats(self, func):
+        name = func.__name__
+        if name not in self.queues:
+            raise Exception(f"Function {name} is not registered.")
+        schedule = self.schedules[name]
+        return {"rate": schedule.stats[0],
+                "target_rate": 1.0 / schedule.period if schedule.period else None,
+                "deadline_misses": int(schedule.stats[1])}
+
+    def get_metrics(self, func=None):
+        # Snapshot of one task's metrics, or a dict with every task's metrics when func is None
+        if func is None:
+            return {name: self._metrics(name) for name in self.queues}
+        name = func.__name__
+        if name not in self.queues:
+            raise Exception(f"Function {name} is not registered.")
+        return self._metrics(name)
+
+    def _metrics(self, name):
+        snapshot = self.metrics[name].snapshot()
+        if name in self.shared_runs:
+            snapshot["runs"] = self.shared_runs[name].value
+        schedule = self.schedules[name]
+        snapshot["rate"] = schedule.stats[0]
+        snapshot["deadline_misses"] = int(schedule.stats[1])
+        snapshot["queue"] = self.queues[name].stats()
+        return snapshot
+
+    def draw_metrics(self, frame, origin=(10, 20), color=(0, 255, 0), scale=0.45):
+        # One line per task: rate, execution time, result age and queue occupancy
+        x, y = origin
+        for name, m in self.get_metrics().items():
+            exec_ms, age_ms, q = m["exec_ms"], m["age_ms"], m["queue"]
+            text = (f"{name}: {m['rate']:.1f} Hz"
+                    f" | exec p50 {self._ms(exec_ms['p50'])} p95 {self._ms(exec_ms['p95'])} p99 {self._ms(exec_ms['p99'])}"
+                    f" | age p50 {self._ms(age_ms['p50'])}"
+                    f" | queue {q['size']}/{q['capacity']} (peak {q['peak']}, dropped {q['dropped']})")
+            cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 3)
+            cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, 1)
+            y += int(30 * scale) + 6
+        return frame
+
+    @staticmethod
+    def _ms(value):
+        return "-" if value is None else f"{value:.1f}ms"
 
     def start(self):
+        # Workers must share our resource tracker, or it reports their shared memory as leaked at exit
+        if self.processes:
+            resource_tracker.ensure_running()
+        for process in self.processes:
+            process.start()
         for thread in self.threads:
             thread.start()
 
+        if self.coroutines:
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.loop_thread.start()
+            for name, func, args, kwargs in self.coroutines:
+                coroutine = self._run_coroutine_task(name, func, args, kwargs)
+                self.loop_futures.append(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    async def _cancel_coroutines(self):
+        # Runs on the manager's loop, the only other tasks there are the coroutine tasks
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _wake_async_consumers(self):
+        # Pending next() calls raise, results() iterators end
+        with self.async_lock:
+            waiters = [waiter for name in self.async_waiters for waiter in self.async_waiters[name]]
+            subscribers = [subscriber for name in self.async_subscribers for subscriber in self.async_subscribers[name]]
+            for name in self.async_waiters:
+                self.async_waiters[name] = []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_fail, future, RuntimeError("ThreadManager is stopped"))
+        for loop, results in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_offer, results, _STOPPED)
+
     def stop(self):
         self.running = False
+        self.wakeup.set()
+        self.stop_event.set()
+        self._wake_async_consumers()
+        if self.loop is not None:
+            # Let the cancelled coroutine tasks run their cleanup before the loop stops
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_coroutines(), self.loop).result(timeout=1.0)
+            except concurrent.futures.TimeoutError:
+                pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join(timeout=1.0)
+            if not self.loop_thread.is_alive():
+                self.loop.close()
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
         for thread in self.threads:
             thread.join(timeout=1.0)
 
@@ -178,6 +719,7 @@ if __name__ == "__main__":
 
         # thanks to our main thread we can always print the frame!
         if frame is not None:
+            manager.draw_metrics(frame, origin=(20, 150))
             cv2.imshow("Live", frame)
 
         if (cv2.waitKey(1) & 0xFF) == 27:
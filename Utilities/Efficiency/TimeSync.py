@@ -0,0 +1,250 @@
+import threading
+import time
+import numpy as np
+from collections import deque
+
+
+def align(query_times, times, values=None, tolerance=None, interpolate=False):
+    # Offline join of two sorted time columns in O(n log n), replaces matching every frame against every sample.
+    # Returns the index of the nearest sample per query (-1 when further than tolerance),
+    # or with interpolate=True the values linearly interpolated at the query times (NaN outside the recording).
+    query_times = np.asarray(query_times, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+
+    if interpolate:
+        if len(times) == 0:
+            return np.full(query_times.shape, np.nan)
+        values = np.asarray(values, dtype=np.float64)
+        return np.interp(query_times, times, values, left=np.nan, right=np.nan)
+
+    # Fewer than two samples leave no bracketing pair, every query maps to the only sample or to nothing
+    if len(times) < 2:
+        nearest = np.full(query_times.shape, len(times) - 1, dtype=np.intp)
+        if tolerance is not None and len(times):
+            nearest[np.abs(times[0] - query_times) > tolerance] = -1
+        return nearest
+
+    right = np.clip(np.searchsorted(times, query_times), 1, len(times) - 1)
+    left = right - 1
+    nearest = np.where(query_times - times[left] <= times[right] - query_times, left, right)
+    if tolerance is not None:
+        nearest[np.abs(times[nearest] - query_times) > tolerance] = -1
+    return nearest
+
+
+class TimeSeries:
+
+    # Ring of (time, value) kept in time order on the reference clock (time.monotonic of this process).
+    # Samples stamped by another clock (time.time, a device counter, ...) are mapped with an estimated offset:
+    # the smallest arrival - source_time seen over the window is taken as offset plus the fixed latency.
+
+    def __init__(self, capacity=1024, latency=0.0, window=256):
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.empty(capacity, dtype=object)
+        self.capacity = capacity
+        self.count = 0
+        self.latency = latency
+        self.delays = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def append(self, value, source_time=None, arrival=None):
+        # source_time in seconds on the source's own clock, arrival defaults to now
+        arrival = time.monotonic() if arrival is None else arrival
+        with self.lock:
+            if source_time is None:
+                t = arrival - self.latency
+            else:
+                self.delays.append(arrival - source_time)
+                t = source_time + min(self.delays) - self.latency
+
+            # Jitter can put a sample before the previous one, keep the ring sorted for the binary search
+            if self.count:
+                t = max(t, self.times[(self.count - 1) % self.capacity])
+
+            slot = self.count % self.capacity
+            self.times[slot] = t
+            self.values[slot] = value
+            self.count += 1
+        return t
+
+    @property
+    def offset(self):
+        # Estimated source clock to reference clock offset (includes the smallest transport delay)
+        with self.lock:
+            return min(self.delays) if self.delays else None
+
+    @property
+    def jitter(self):
+        # Mean arrival delay above the smallest one
+        with self.lock:
+            if not self.delays:
+                return None
+            return sum(self.delays) / len(self.delays) - min(self.delays)
+
+    def _start(self):
+        # Physical slot of the oldest sample, caller holds self.lock
+        return self.count % self.capacity if self.count > self.capacity else 0
+
+    def _size(self):
+        return min(self.count, self.capacity)
+
+    def _at(self, i):
+        p = (self._start() + i) % self.capacity
+        return self.times[p], self.values[p]
+
+    def _index(self, t):
+        # Logical index of the first sample at or after t, the ring is two sorted segments at most
+        n, start = self._size(), self._start()
+        if start == 0:
+            return int(np.searchsorted(self.times[:n], t))
+        if t <= self.times[-1]:
+            return int(np.searchsorted(self.times[start:], t))
+        return self.capacity - start + int(np.searchsorted(self.times[:start], t))
+
+    def nearest(self, t, tolerance=None):
+        # Returns (time, value) of the sample closest to t, or None
+        with self.lock:
+            n = self._size()
+            if n == 0:
+                return None
+            i = self._index(t)
+            candidates = [self._at(j) for j in (i - 1, i) if 0 <= j < n]
+            sample = min(candidates, key=lambda c: abs(c[0] - t))
+        if tolerance is not None and abs(sample[0] - t) > tolerance:
+            return None
+        return sample
+
+    def interpolate(self, t):
+        # Linear interpolation between the samples around t, values must support + - and * (numbers, arrays)
+        with self.lock:
+            n = self._size()
+            i = self._index(t)
+            if i < n and self._at(i)[0] == t:
+                return self._at(i)[1]
+            if i == 0 or i >= n:
+                return None
+            (t0, v0), (t1, v1) = self._at(i - 1), self._at(i)
+        w = (t - t0) / (t1 - t0)
+        return v0 + (v1 - v0) * w
+
+    def between(self, t0, t1):
+        # All (time, value) samples with t0 <= time <= t1
+        with self.lock:
+            start = self._index(t0)
+            end = min(self._index(np.nextafter(t1, np.inf)), self._size())
+            return [self._at(i) for i in range(start, end)]
+
+    def arrays(self):
+        # Copy of the (times, values) columns in time order
+        with self.lock:
+            start, n = self._start(), self._size()
+            order = (start + np.arange(n)) % self.capacity
+            return self.times[order], self.values[order]
+
+
+class TimeSync:
+
+    # One TimeSeries per source, joined on the reference clock
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.sources = {}
+
+    def add_source(self, name, capacity=None, latency=0.0, window=256):
+        # latency: known fixed delay between the event and its timestamp (e.g. exposure, filtering on the device)
+        self.sources[name] = TimeSeries(capacity or self.capacity, latency, window)
+        return self.sources[name]
+
+    def append(self, name, value, source_time=None, arrival=None):
+        return self.sources[name].append(value, source_time, arrival)
+
+    def nearest(self, name, t, tolerance=None):
+        return self.sources[name].nearest(t, tolerance)
+
+    def interpolate(self, name, t):
+        return self.sources[name].interpolate(t)
+
+    def join(self, t, names=None, tolerance=None, interpolate=False):
+        # Value of every source at time t, None where a source has nothing close enough
+        joined = {}
+        for name in names or self.sources:
+            if interpolate:
+                joined[name] = self.sources[name].interpolate(t)
+            else:
+                sample = self.sources[name].nearest(t, tolerance)
+                joined[name] = None if sample is None else sample[1]
+        return joined
+
+    def estimate_lag(self, a, b, max_lag=0.5, step=0.005, key=float):
+        # Latency of b relative to a from the cross-correlation of both signals, e.g. the ball height from the
+        # sensor against the ball position in the image. Positive means b sees events later than a.
+        # key turns a stored value into a number.
+        times_a, values_a = self.sources[a].arrays()
+        times_b, values_b = self.sources[b].arrays()
+        start, end = max(times_a[0], times_b[0]), min(times_a[-1], times_b[-1])
+        if end - start <= 2 * max_lag:
+            return None
+
+        grid = np.arange(start, end, step)
+        signal_a = np.interp(grid, times_a, [key(v) for v in values_a])
+        signal_b = np.interp(grid, times_b, [key(v) for v in values_b])
+        signal_a = (signal_a - signal_a.mean()) / (signal_a.std() or 1.0)
+        signal_b = (signal_b - signal_b.mean()) / (signal_b.std() or 1.0)
+
+        shifts = np.arange(-int(max_lag / step), int(max_lag / step) + 1)
+        scores = [np.dot(signal_a[max(0, -s):len(grid) - max(0, s)], signal_b[max(0, s):len(grid) - max(0, -s)])
+                  / (len(grid) - abs(s)) for s in shifts]
+        return shifts[int(np.argmax(scores))] * step
+
+    def stats(self):
+        return {name: {"samples": series.count, "offset": series.offset, "jitter": series.jitter}
+                for name, series in self.sources.items()}
+
+
+if __name__ == "__main__":
+
+    import cv2
+    from CameraStream import CameraStream
+    from SerialStream import SerialStream
+
+    sync = TimeSync(capacity=2048)
+    sync.add_source("frame")
+    sync.add_source("height")
+
+    cam = CameraStream(0)
+    ser = SerialStream(port='/dev/ttyUSB0', baudrate=9600)
+
+    def collect_serial():
+        # Each buffer entry is {time_ns: line}, stamped on the wall clock
+        last = None
+        while ser.running:
+            for entry in ser.read(10):
+                (timestamp_ns, line), = entry.items()
+                if last is None or timestamp_ns > last:
+                    last = timestamp_ns
+                    sync.append("height", line, source_time=timestamp_ns / 1e9)
+            time.sleep(0.005)
+
+    threading.Thread(target=collect_serial, daemon=True).start()
+
+    seq = 0
+    while True:
+        new = cam.read_new(seq, timeout=1.0)
+        if new is None:
+            continue
+        seq, timestamp, frame = new
+        t = sync.append("frame", seq, source_time=timestamp)
+
+        sample = sync.nearest("height", t, tolerance=0.05)
+        text = f"height {sample[1]} ({(sample[0] - t) * 1000:+.1f} ms)" if sample else "no sample"
+        view = frame.copy()
+        cv2.putText(view, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        cv2.imshow("TimeSync", view)
+
+        if cv2.waitKey(1) & 0xFF == 27:
+            break
+
+    print(sync.stats())
+    cam.stop()
+    ser.stop()
+    cv2.destroyAllWindows()
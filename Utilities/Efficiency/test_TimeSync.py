@@ -0,0 +1,19 @@
+import numpy as np
+
+from TimeSync import align
+
+
+def test_align_nearest():
+    assert align([0.0, 1.4, 1.6, 5.0], [0.0, 1.0, 2.0]).tolist() == [0, 1, 2, 2]
+    assert align([0.0, 1.4, 5.0], [0.0, 1.0, 2.0], tolerance=0.5).tolist() == [0, 1, -1]
+
+
+def test_align_single_sample():
+    assert align([0, 1, 2], [1.0]).tolist() == [0, 0, 0]
+    assert align([0, 1, 2], [1.0], tolerance=0.5).tolist() == [-1, 0, -1]
+
+
+def test_align_no_samples():
+    assert align([0, 1, 2], []).tolist() == [-1, -1, -1]
+    assert align([0, 1, 2], [], tolerance=0.5).tolist() == [-1, -1, -1]
+    assert np.isnan(align([0, 1, 2], [], [], interpolate=True)).all()
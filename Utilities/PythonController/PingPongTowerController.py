@@ -1,12 +1,16 @@
 """ IMPORTS """
 
 import time
+import threading
+from collections import deque
 
 import numpy as np
 from serial import Serial
 from serial.tools import list_ports
 import re
 
+from SerialStream import SerialWriter  # get this module from Utilities/Efficiency/SerialStream.py
+
 
 """ CLASS """
 
@@ -23,6 +27,9 @@ class Controller:
     # Dict of open ports
     __open_ports = {}
 
+    # Height report sent by the controller, any other line is taken as a response
+    __HEIGHT_PATTERN = r"[Hh]+[eight: ]*[0-9A-f]{4}"
+
     # Override in order to control Serial object referencing
     def __new__(cls, port=None):
 
@@ -43,12 +50,15 @@ class Controller:
         else:
             obj = super().__new__(cls)
             obj.__serial = Serial(port, 115200, timeout=1)
+            obj.__read_lock = threading.Lock()      # One reader at a time: caller or background writer
+            obj.__heights = deque(maxlen=32)        # Height reports read by the background writer
+            obj.__writer = None
             cls.__open_ports[port] = obj
 
         return obj
 
     # Sets fan speed pwm in range [0:100] percent
-    def set_pwm(self, value: int):
+    def set_pwm(self, value: int, block=True):
 
         # Check input
         if not isinstance(value, (int, float)):
@@ -57,16 +67,41 @@ class Controller:
         # Format pwm into message for controller
         m = self.__format_message(value)
 
+        # Queue without waiting: a background thread sends only the newest pwm when the link is behind
+        # and matches the response, see the returned message's status, response and latency_ms.
+        # On a closed port the message comes back with status "error" right away.
+        if not block:
+            return self.__get_writer().send(m, key="pwm", ack=self.__is_response)
+
         # Send with response
         if self.__serial.is_open:
             self.__serial.write(m)
-            response = self.__serial.readline().decode('utf-8')
+            with self.__read_lock:
+                response = self.__serial.readline().decode('utf-8')
         else:
             response = f"'{m}' failed to  send, port closed"
 
         # Return result
         return response
 
+    # Send-to-ack statistics of the non-blocking set_pwm
+    def writer_stats(self):
+        return self.__get_writer().stats()
+
+    def __get_writer(self):
+        if self.__writer is None:
+            self.__writer = SerialWriter(self.__serial, maxsize=8, ack_timeout=1.0,
+                                         read_line=self.__read_line, on_unmatched=self.__heights.append)
+        return self.__writer
+
+    def __read_line(self):
+        with self.__read_lock:
+            return self.__serial.readline().decode("utf-8")
+
+    @staticmethod
+    def __is_response(line):
+        return re.match(Controller.__HEIGHT_PATTERN, line) is None
+
     # Toggle print
     def toggle_printing(self, enabled: bool):
 
@@ -107,16 +142,23 @@ class Controller:
     # Retrieves height of ping ball from ping pong controller
     def get_ball_height(self, block_timeout=True):
 
-        # Block until receipt
-        while not len(r := self.__serial.readline()) and block_timeout:
-            time.sleep(0.03)
+        # Height reports picked up by the background writer come first
+        if self.__heights:
+            s = self.__heights.popleft()
+        else:
+            # Block until receipt
+            while True:
+                with self.__read_lock:
+                    r = self.__serial.readline()
+                if len(r) or not block_timeout:
+                    break
+                time.sleep(0.03)
 
-        # Decode as string
-        s = r.decode("utf-8")
+            # Decode as string
+            s = r.decode("utf-8")
 
         # Search using re
-        p = r"[Hh]+[eight: ]*[0-9A-f]{4}"
-        match = re.match(p, s)
+        match = re.match(Controller.__HEIGHT_PATTERN, s)
         if match is not None:
             h = match[0][-4:]
             h = int(h, 16)
@@ -143,6 +185,9 @@ class Controller:
 
 
     def __del__(self):
+        if self.__writer is not None:
+            self.__writer.stop()
+
         if self.__serial.is_open:
             self.__serial.close()
 
@@ -169,5 +214,5 @@ if __name__ == "__main__":
         # This is where you should do something intelligent with the height data
         pwm = 50 * np.sin(2 * np.pi * (1/3) * time.monotonic()) + 10  # Synthetic output
 
-        # Send a new pwm value to the controller
-        c.set_pwm(pwm)
+        # Send a new pwm value to the controller without waiting for its response
+        c.set_pwm(pwm, block=False)
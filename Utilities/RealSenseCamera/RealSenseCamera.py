@@ -1,10 +1,11 @@
 """ IMPORTS """
 
+import weakref
 import time
 import pyrealsense2 as rs
 import cv2 as cv2
 import numpy as np
-from threading import Thread, Lock
+from threading import Thread, Lock, RLock, Event, Condition
 from dataclasses import dataclass
 import datetime
     
@@ -25,36 +26,399 @@ def intrinsics_to_numpy(intrinsics: rs.intrinsics):
     return camera_matrix, distortion
 
 
+def extrinsics_to_numpy(extrinsics: rs.extrinsics):
+    """ Converts realsense extrinsics into a rotation matrix and translation vector (meters) """
+
+    rotation = np.array(extrinsics.rotation).reshape(3, 3).T  # Stored column major
+    translation = np.array(extrinsics.translation)
+
+    return rotation, translation
+
+
+def connected_devices():
+    """ Serial numbers of the connected realsense devices """
+
+    realsense_ctx = rs.context()
+    return [device.get_info(rs.camera_info.serial_number) for device in realsense_ctx.query_devices()]
+
+
+def profile_key(profile):
+    """ Identifies a stream profile in one SDK call, filters like decimation output a cloned profile with its own id """
+
+    return profile.unique_id()
+
+
+def deproject_pixels(intrinsics: rs.intrinsics, uv, depth):
+    """ Vectorized rs2_deproject_pixel_to_point: (N, 2) pixels and (N,) depths to (N, 3) points """
+
+    uv = np.asarray(uv, dtype=np.float64).reshape(-1, 2)
+    depth = np.asarray(depth, dtype=np.float64).reshape(-1)
+    c = intrinsics.coeffs
+
+    if intrinsics.model not in (rs.distortion.none, rs.distortion.brown_conrady, rs.distortion.inverse_brown_conrady,
+                                rs.distortion.modified_brown_conrady):
+        # Other models (fisheye) are left to the SDK, one point at a time
+        return np.array([rs.rs2_deproject_pixel_to_point(intrinsics, [u, v], d) for (u, v), d in zip(uv, depth)])
+
+    x = (uv[:, 0] - intrinsics.ppx) / intrinsics.fx
+    y = (uv[:, 1] - intrinsics.ppy) / intrinsics.fy
+
+    if intrinsics.model != rs.distortion.none:
+        # Fixed point iteration (10 steps like the SDK) that undoes project_points for the same model
+        xo, yo = x, y
+        for _ in range(10):
+            r2 = x * x + y * y
+            icdist = 1 / (1 + ((c[4] * r2 + c[1]) * r2 + c[0]) * r2)
+            if intrinsics.model == rs.distortion.brown_conrady:
+                # Tangential terms from the undistorted point
+                xq, yq = x, y
+            else:
+                # Modified and inverse brown conrady: tangential terms from the radially distorted point
+                xq, yq = x / icdist, y / icdist
+            x = (xo - (2 * c[2] * xq * yq + c[3] * (r2 + 2 * xq * xq))) * icdist
+            y = (yo - (2 * c[3] * xq * yq + c[2] * (r2 + 2 * yq * yq))) * icdist
+
+    return np.column_stack((x * depth, y * depth, depth))
+
+
+def project_points(intrinsics: rs.intrinsics, xyz):
+    """ Vectorized rs2_project_point_to_pixel: (N, 3) points to (N, 2) pixels, NaN for points at z=0 """
+
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    c = intrinsics.coeffs
+
+    if intrinsics.model not in (rs.distortion.none, rs.distortion.brown_conrady, rs.distortion.inverse_brown_conrady,
+                                rs.distortion.modified_brown_conrady):
+        return np.array([rs.rs2_project_point_to_pixel(intrinsics, list(point)) for point in xyz])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = xyz[:, 0] / xyz[:, 2]
+        y = xyz[:, 1] / xyz[:, 2]
+
+    if intrinsics.model != rs.distortion.none:
+        r2 = x * x + y * y
+        f = 1 + c[0] * r2 + c[1] * r2 * r2 + c[4] * r2 * r2 * r2
+        if intrinsics.model == rs.distortion.brown_conrady:
+            # Tangential terms from the undistorted point
+            x, y = (x * f + 2 * c[2] * x * y + c[3] * (r2 + 2 * x * x),
+                    y * f + 2 * c[3] * x * y + c[2] * (r2 + 2 * y * y))
+        else:
+            # Modified and inverse brown conrady: tangential terms from the radially distorted point
+            x, y = x * f, y * f
+            x, y = (x + 2 * c[2] * x * y + c[3] * (r2 + 2 * x * x),
+                    y + 2 * c[3] * x * y + c[2] * (r2 + 2 * y * y))
+
+    return np.column_stack((x * intrinsics.fx + intrinsics.ppx, y * intrinsics.fy + intrinsics.ppy))
+
+
 """ CLASSES """
 
+class StreamCalibration:
+    """ Intrinsics of one stream profile, looked up and converted once """
+
+    def __init__(self, profile):
+
+        self.key = profile_key(profile)
+        self.intrinsics = profile.as_video_stream_profile().get_intrinsics()
+        self.camera_matrix, self.distortion = intrinsics_to_numpy(self.intrinsics)
+        self._rays = None
+
+    @classmethod
+    def from_intrinsics(cls, intrinsics: rs.intrinsics):
+        """ Calibration without a stream profile, e.g. restored from a recording """
+
+        calibration = cls.__new__(cls)
+        calibration.key = None
+        calibration.intrinsics = intrinsics
+        calibration.camera_matrix, calibration.distortion = intrinsics_to_numpy(intrinsics)
+        calibration._rays = None
+        return calibration
+
+    @property
+    def rays(self):
+        """ (H, W, 3) point at depth 1 for every pixel, computed once per profile """
+
+        if self._rays is None:
+            v, u = np.mgrid[0:self.intrinsics.height, 0:self.intrinsics.width]
+            uv = np.column_stack((u.ravel(), v.ravel()))
+            rays = deproject_pixels(self.intrinsics, uv, np.ones(len(uv)))
+            self._rays = rays.reshape(self.intrinsics.height, self.intrinsics.width, 3).astype(np.float32)
+            self._rays.setflags(write=False)
+        return self._rays
+
+
+class SyntheticSource:
+    """ Software RealSense device fed with generated numpy depth and color maps (no camera needed) """
+
+    def __init__(self, width=640, height=480, fps=30, frames=None, depth_units=0.001, noise=2.0, seed=0,
+                 generator=None):
+
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames                    # Number of frames before the sequence ends, None runs forever
+        self.depth_units = depth_units          # Meters per depth unit, like a D435
+        self.noise = noise                      # Depth noise in millimeters, seeded so every run is identical
+        self.seed = seed
+        self.generator = generator or self.scene  # generator(n) -> (depth uint16 HxW, color uint8 HxWx3)
+
+        # Intrinsics close to a D435 color sensor (69 degrees horizontal field of view)
+        self.intrinsics = rs.intrinsics()
+        self.intrinsics.width = width
+        self.intrinsics.height = height
+        self.intrinsics.fx = self.intrinsics.fy = 0.5 * width / np.tan(np.radians(34.5))
+        self.intrinsics.ppx = width / 2
+        self.intrinsics.ppy = height / 2
+        self.intrinsics.model = rs.distortion.brown_conrady
+        self.intrinsics.coeffs = [0, 0, 0, 0, 0]
+
+        self.__v, self.__u = np.mgrid[0:height, 0:width].astype(np.float32)
+        self.__rng = np.random.default_rng(seed)
+
+    def scene(self, n):
+        """ Tilted wall with a ball moving up and down in front of it """
+
+        # Wall at 1.5 m, further away towards the top of the image
+        depth_mm = 1500 + 0.5 * (self.height / 2 - self.__v)
+        color = np.empty((self.height, self.width, 3), np.uint8)
+        color[...] = (60 + 120 * self.__v / self.height)[..., None]
+
+        # Ball at 0.8 m with a radius of 40 px
+        cx = self.width / 2
+        cy = self.height / 2 + 0.35 * self.height * np.sin(np.pi * n / self.fps)
+        d2 = (self.__u - cx) ** 2 + (self.__v - cy) ** 2
+        ball = d2 < 40 ** 2
+        depth_mm[ball] = 800 - np.sqrt(40 ** 2 - d2[ball])
+        color[ball] = (0, 128, 255)
+
+        if self.noise:
+            depth_mm += self.__rng.normal(0, self.noise, depth_mm.shape)
+
+        depth = np.clip(depth_mm / (self.depth_units * 1000), 0, 65535).astype(np.uint16)
+        return depth, color
+
+    def start(self, realtime=True):
+
+        self.__realtime = realtime
+        self.__frame_number = 0
+        self.__rng = np.random.default_rng(self.seed)
+        self.__t0 = time.perf_counter()
+
+        self.__device = rs.software_device()
+        self.__depth_sensor = self.__device.add_sensor("Depth")
+        self.__color_sensor = self.__device.add_sensor("Color")
+        self.__depth_sensor.add_read_only_option(rs.option.depth_units, self.depth_units)
+
+        self.__depth_profile = self.__depth_sensor.add_video_stream(self.__stream(rs.stream.depth, rs.format.z16, 2, 0))
+        self.__color_profile = self.__color_sensor.add_video_stream(self.__stream(rs.stream.color, rs.format.bgr8, 3, 1))
+
+        # Depth and color share one optical center, align still does the full reprojection
+        extrinsics = rs.extrinsics()
+        extrinsics.rotation = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+        extrinsics.translation = [0, 0, 0]
+        self.__depth_profile.register_extrinsics_to(self.__color_profile, extrinsics)
+
+        self.__device.create_matcher(rs.matchers.default)
+        self.__syncer = rs.syncer()
+        self.__depth_sensor.open(self.__depth_profile)
+        self.__color_sensor.open(self.__color_profile)
+        self.__depth_sensor.start(self.__syncer)
+        self.__color_sensor.start(self.__syncer)
+
+    def __stream(self, stream, fmt, bpp, uid):
+
+        video_stream = rs.video_stream()
+        video_stream.type = stream
+        video_stream.fmt = fmt
+        video_stream.bpp = bpp
+        video_stream.index = 0
+        video_stream.uid = uid
+        video_stream.width = self.width
+        video_stream.height = self.height
+        video_stream.fps = self.fps
+        video_stream.intrinsics = self.intrinsics
+        return video_stream
+
+    def __push(self, sensor, profile, image, timestamp):
+
+        frame = rs.software_video_frame()
+        frame.pixels = image
+        frame.bpp = image.itemsize * (image.shape[2] if image.ndim == 3 else 1)
+        frame.stride = self.width * frame.bpp
+        frame.timestamp = timestamp
+        frame.domain = rs.timestamp_domain.hardware_clock
+        frame.frame_number = self.__frame_number
+        frame.profile = profile.as_video_stream_profile()
+        sensor.on_video_frame(frame)
+
+    def wait_for_frames(self):
+
+        n = self.__frame_number
+        if self.frames is not None and n >= self.frames:
+            raise RuntimeError("Synthetic sequence ended")
+
+        # Real time pacing, otherwise frames are produced as fast as they are consumed
+        if self.__realtime:
+            delay = self.__t0 + n / self.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        # Keep the maps alive until the next frame, the software frames point into them
+        depth, color = self.__pixels = self.generator(n)
+        timestamp = n * 1000 / self.fps
+        self.__push(self.__depth_sensor, self.__depth_profile, depth, timestamp)
+        self.__push(self.__color_sensor, self.__color_profile, color, timestamp)
+        self.__frame_number += 1
+
+        return self.__syncer.wait_for_frames()
+
+    def stop(self):
+
+        for sensor in (self.__depth_sensor, self.__color_sensor):
+            sensor.stop()
+            sensor.close()
+
+
+class BufferPool:
+    """ Reusable numpy buffers, a buffer is handed out again once the array leased from it is released """
+
+    def __init__(self, size=4):
+
+        self.size = size            # Buffers kept per shape, more frames held at once get a fresh allocation
+        self.__buffers = []
+        self.__leased = set()       # id() of the pooled buffers that are handed out
+        self.__lock = Lock()
+
+    def copy(self, array):
+
+        with self.__lock:
+            target = None
+            for buffer in self.__buffers:
+                if buffer.shape == array.shape and buffer.dtype == array.dtype and id(buffer) not in self.__leased:
+                    target = buffer
+                    break
+
+            if target is None:
+                target = np.empty_like(array)
+                same_shape = [b for b in self.__buffers if b.shape == array.shape and b.dtype == array.dtype]
+                if len(same_shape) < self.size:
+                    self.__buffers.append(target)
+            self.__leased.add(id(target))
+
+        np.copyto(target, array)
+
+        # The lease is a view through a memoryview, so every slice of it refers to the lease and not to the buffer:
+        # the buffer is released once the lease and everything derived from it are gone
+        lease = np.asarray(memoryview(target))
+        weakref.finalize(lease, self.__leased.discard, id(target))  # No lock, the finalizer may run inside copy()
+        return lease
+
+
 @dataclass
 class RealSenseFrame:
 
-    def __init__(self, color_map=None, depth_map=None, left_ir_map=None, right_ir_map=None):
+    def __init__(self, color_map=None, depth_map=None, left_ir_map=None, right_ir_map=None,
+                 color_calibration=None, depth_calibration=None, depth_to_color=None, depth_scale=None,
+                 sdk_frames=None, device_timestamp=None, frame_number=None, serial=None):
         self.time_stamp = datetime.datetime.utcnow()
         self.color_map = color_map
         self.depth_map = depth_map
         self.left_ir_map = left_ir_map
         self.right_ir_map = right_ir_map
 
+        # Calibration the maps were captured with (StreamCalibration, rs.extrinsics, depth units to mm)
+        self.color_calibration = color_calibration
+        self.depth_calibration = depth_calibration
+        self.depth_to_color = depth_to_color
+        self.depth_scale = depth_scale
+
+        # SDK frames behind the maps, holding them keeps librealsense from recycling that memory
+        self.sdk_frames = sdk_frames
+
+        # Capture time in ms from the SDK (on the host clock for live devices, comparable between devices)
+        self.device_timestamp = device_timestamp
+        self.frame_number = frame_number
+        self.serial = serial
+
+        # Derived maps, computed on first use and shared by every consumer of this frame (read-only, copy to draw)
+        self.__derived = {}
+        self.__derived_lock = RLock()  # Reentrant: pointcloud uses depth_mm
+
+    def __get_derived(self, name, compute):
+
+        with self.__derived_lock:
+            if name not in self.__derived:
+                result = compute()
+                result.setflags(write=False)
+                self.__derived[name] = result
+            return self.__derived[name]
+
+    @property
+    def depth_mm(self):
+        """ Depth in millimeters as float32, 0 where there is no measurement """
+        scale = self.depth_scale or 1.0
+        return self.__get_derived("depth_mm", lambda: self.depth_map.astype(np.float32) * np.float32(scale))
+
+    @property
+    def depth_colormap(self):
+        """ Depth colorized for display (JET), stretched over the depth range of this frame like the stream view """
+        return self.__get_derived("depth_colormap", lambda: cv2.applyColorMap(
+            cv2.normalize(cv2.convertScaleAbs(self.depth_map, alpha=0.03), None, 0, 255, cv2.NORM_MINMAX),
+            cv2.COLORMAP_JET))
+
+    @property
+    def gray(self):
+        return self.__get_derived("gray", lambda: cv2.cvtColor(self.color_map, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def valid_mask(self):
+        """ True where the depth map has a measurement """
+        return self.__get_derived("valid_mask", lambda: self.depth_map > 0)
+
+    @property
+    def pointcloud(self):
+        """ (H, W, 3) points in millimeters in the frame of the depth map, zeros where depth is missing """
+        calibration = self.depth_calibration or self.color_calibration
+        if calibration is None:
+            raise ValueError("pointcloud needs the depth or color calibration of the frame")
+        return self.__get_derived("pointcloud", lambda: calibration.rays * self.depth_mm[..., None])
+
 
 class RealSenseCamera:
 
-    def __init__(self, on_update=None):
+    def __init__(self, on_update=None, source=None, realtime=True, repeat=False, pipelined=False, serial=None,
+                 sync_mode=None):
+
+        # source: None for a live camera, the path to a .bag recording or a SyntheticSource
+        # realtime: play recordings at their recorded speed, or as fast as the pipeline can process them
+        # pipelined: capture, align and filter in separate threads, higher frame rate for a frame or two of latency
+        self.__source = source
+        self.__realtime = realtime
+        self.__pipelined = pipelined
+        self.__sync_mode = sync_mode    # Hardware sync (rs.option.inter_cam_sync_mode): 1 master, 2 slave
+        self.serial = serial
 
         # Create the pipeline (handles all connected realsense devices) and device config object (optional)
         self.__pipeline = rs.pipeline()
         self.__config = rs.config()
         
-        realsense_ctx = rs.context()
-        connected_devices = []
-        for i in range(len(realsense_ctx.devices)):
-            detected_camera = realsense_ctx.devices[i].get_info(rs.camera_info.serial_number)
-            connected_devices.append(detected_camera)
-
-        # Enable depth and color sensors
-        self.__config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)   # Depth map uint16
-        self.__config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 30)  # Color map uint8 (x3 channels)
+        if source is None and serial is not None:
+            # Open this device only, without a serial the pipeline picks any connected camera
+            if serial not in connected_devices():
+                raise ValueError(f"no realsense device with serial {serial}, connected: {connected_devices()}")
+            self.__config.enable_device(serial)
+
+        if source is None:
+            # Enable depth and color sensors
+            self.__config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)   # Depth map uint16
+            self.__config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 30)  # Color map uint8 (x3 channels)
+        elif isinstance(source, str):
+            # Recording from the RealSense Viewer, resolution and format come from the file
+            self.__config.enable_device_from_file(source, repeat_playback=repeat)
+            self.__config.enable_stream(rs.stream.depth)
+            self.__config.enable_stream(rs.stream.color)
+        elif not isinstance(source, SyntheticSource):
+            raise TypeError("source must be None, a .bag file path or a SyntheticSource")
 
         # Configure depth frame post processing pipeline
         self.__depth_filters = [rs.decimation_filter(magnitude=1),
@@ -68,14 +432,22 @@ class RealSenseCamera:
         self.__align = rs.align(rs.stream.color)   # Align object which aligns depth to color frames
         self.__kill = False                        # Flag to kill background process
         self.__thread = Thread()                   # Background threading object
-        self.__mutex = Lock()
+        self.__cond = Condition()                  # Signals every new frame to get_latest_frame
+        self.__running = False
+        self.__pool = BufferPool()
 
         # Properties
         self.__latest_frame = RealSenseFrame()
-        self.__prev_timestamp = self.__latest_frame.time_stamp
+        self.__frame_count = 0
+        self.__prev_count = 0
 
         self.__depth_frame = None
         self.__color_frame = None
+
+        # Calibration cache, refreshed only when a stream profile changes
+        self.__color_calibration = None
+        self.__depth_calibration = None
+        self.__depth_to_color = None
         self.__left_ir_frame = None
         self.__right_ir_frame = None
 
@@ -92,6 +464,7 @@ class RealSenseCamera:
             return
 
         self.__kill = False
+        self.__running = True
         self.__thread = Thread(target=self.__camera_thread, daemon=True)
         self.__thread.start()
 
@@ -103,71 +476,191 @@ class RealSenseCamera:
 
     def __camera_thread(self):
 
-        # Start streaming from realsense camera
-        profile = self.__pipeline.start(self.__config)
-
-        # Some RealSense cameras report distance values in odd units (1/32 meter)
-        # Get the scale of the depth camera --> Scales distance to Meters --> Scale to Millimeters
-        self.__depth_scale = profile.get_device().first_depth_sensor().get_depth_scale() * 1000
+        if isinstance(self.__source, SyntheticSource):
+            # Software device, frames still pass through the same align and filter chain
+            self.__source.start(self.__realtime)
+            self.__depth_scale = self.__source.depth_units * 1000
+            wait_for_frames = self.__source.wait_for_frames
+            stop = self.__source.stop
+        else:
+            # Start streaming from realsense camera
+            profile = self.__pipeline.start(self.__config)
+            device = profile.get_device()
+            if device.is_playback():
+                device.as_playback().set_real_time(self.__realtime)
+            else:
+                self.serial = device.get_info(rs.camera_info.serial_number)
+
+                # Timestamps on the host clock, so frames of different devices can be matched
+                for sensor in device.query_sensors():
+                    if sensor.supports(rs.option.global_time_enabled):
+                        sensor.set_option(rs.option.global_time_enabled, 1)
+                if self.__sync_mode is not None:
+                    device.first_depth_sensor().set_option(rs.option.inter_cam_sync_mode, self.__sync_mode)
+
+            # Some RealSense cameras report distance values in odd units (1/32 meter)
+            # Get the scale of the depth camera --> Scales distance to Meters --> Scale to Millimeters
+            self.__depth_scale = device.first_depth_sensor().get_depth_scale() * 1000
+            wait_for_frames = self.__pipeline.wait_for_frames
+            stop = self.__pipeline.stop
+
+        stages = []
+        self.__stage_error = None
+        if self.__pipelined:
+            # The SDK releases the GIL while aligning and filtering, so the stages overlap.
+            # The frame queues are bounded: a stage that falls behind drops frames instead of adding latency.
+            self.__align_queue = rs.frame_queue(2, keep_frames=True)
+            self.__filter_queue = rs.frame_queue(2, keep_frames=True)
+            stages = [self.__start_stage(self.__align_queue, self.__align_stage),
+                      self.__start_stage(self.__filter_queue, self.__filter_stage)]
+
+        self.__depth_to_color = None
 
         try:
             while not self.__kill:
 
                 # Capture temporal synchronized device data
-                frames = self.__pipeline.wait_for_frames()
-
-                # Align the depth frame to color frame
-                aligned_frames = self.__align.process(frames)
-
-                # Get the needed frames form the frames pipeline
-                depth_frame = aligned_frames.get_depth_frame()
-                color_frame = aligned_frames.get_color_frame()
-
-                # Apply filters to depth frame
-                for f in self.__depth_filters:
-                    depth_frame = f.process(depth_frame)
-
-                # Update frame references
-                self.__color_frame = color_frame
-                self.__depth_frame = depth_frame
-
-                # Create a numpy array images
-                # A numpy array can be constructed using this protocol with no data marshalling overhead:
-                depth_map = np.asanyarray(depth_frame.get_data())
-                color_map = np.asanyarray(color_frame.get_data())
-
-                # Results object
-                data = RealSenseFrame(color_map, depth_map)
-
-                # Callback
-                if callable(self.__callback):
-                    self.__callback(data)
-
-                # Update latest data
-                with self.__mutex:
-                    self.__latest_frame = data
+                try:
+                    frames = wait_for_frames()
+                except RuntimeError:
+                    # A recording or synthetic sequence that ran out of frames ends the thread
+                    if self.__source is None:
+                        raise
+                    break
+
+                # Extrinsics between the physical sensors, taken before alignment
+                if self.__depth_to_color is None:
+                    self.__depth_to_color = frames.get_depth_frame().profile.get_extrinsics_to(
+                        frames.get_color_frame().profile)
+
+                if self.__pipelined:
+                    self.__align_queue.enqueue(frames)
+                else:
+                    self.__filter_stage(self.__align.process(frames))
 
         finally:
-            self.__pipeline.stop()
+            # Let every stage finish the frames it was handed, in order
+            for thread, running in stages:
+                running.clear()
+                thread.join()
+
+            # Wake up readers, there will be no new frame
+            with self.__cond:
+                self.__running = False
+                self.__cond.notify_all()
+            stop()
             cv2.destroyAllWindows()
 
-    def get_latest_frame(self, copy=True):
-
-        # Black until new frame
-        while self.__latest_frame.time_stamp is self.__prev_timestamp:
-            time.sleep(0.006)
-
-        # Update ts
-        with self.__mutex:
-            self.__prev_timestamp = self.__latest_frame.time_stamp
+        # A failed stage ends the camera thread like an error in serial mode does
+        if self.__stage_error is not None:
+            raise self.__stage_error
+
+    def __start_stage(self, source_queue, process):
+
+        running = Event()
+        running.set()
+        thread = Thread(target=self.__stage_thread, args=(source_queue, process, running), daemon=True)
+        thread.start()
+        return thread, running
+
+    def __stage_thread(self, source_queue, process, running):
+
+        while True:
+            received, frames = source_queue.try_wait_for_frame(100)
+            if received:
+                try:
+                    process(frames.as_frameset())
+                except Exception as error:
+                    # Stop the whole pipeline, the camera thread raises the error once the stages are done
+                    self.__stage_error = error
+                    self.__kill = True
+                    break
+            elif not running.is_set():
+                break
+
+    def __align_stage(self, frames):
+
+        # Align the depth frame to color frame
+        self.__filter_queue.enqueue(self.__align.process(frames))
+
+    def __filter_stage(self, aligned_frames):
+
+        # Get the needed frames form the frames pipeline
+        depth_frame = aligned_frames.get_depth_frame()
+        color_frame = aligned_frames.get_color_frame()
+
+        # Apply filters to depth frame
+        for f in self.__depth_filters:
+            depth_frame = f.process(depth_frame)
+
+        # Update frame references
+        self.__color_frame = color_frame
+        self.__depth_frame = depth_frame
+        self.__update_calibration(color_frame, depth_frame)
+
+        # Create a numpy array images
+        # A numpy array can be constructed using this protocol with no data marshalling overhead:
+        depth_map = np.asanyarray(depth_frame.get_data())
+        color_map = np.asanyarray(color_frame.get_data())
+
+        # Results object
+        data = RealSenseFrame(color_map, depth_map,
+                              color_calibration=self.__color_calibration,
+                              depth_calibration=self.__depth_calibration,
+                              depth_to_color=self.__depth_to_color,
+                              depth_scale=self.__depth_scale,
+                              sdk_frames=(color_frame, depth_frame),
+                              device_timestamp=color_frame.get_timestamp(),
+                              frame_number=color_frame.get_frame_number(),
+                              serial=self.serial)
+
+        # Callback (runs on the filter thread in pipelined mode)
+        if callable(self.__callback):
+            self.__callback(data)
+
+        # Update latest data
+        with self.__cond:
+            self.__latest_frame = data
+            self.__frame_count += 1
+            self.__cond.notify_all()
+
+    def __update_calibration(self, color_frame, depth_frame):
+
+        if self.__color_calibration is None or profile_key(color_frame.profile) != self.__color_calibration.key:
+            self.__color_calibration = StreamCalibration(color_frame.profile)
+        if self.__depth_calibration is None or profile_key(depth_frame.profile) != self.__depth_calibration.key:
+            self.__depth_calibration = StreamCalibration(depth_frame.profile)
+
+    def get_latest_frame(self, copy=True, timeout=None):
+
+        # Block until new frame, None on timeout or when the camera stopped
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__frame_count != self.__prev_count or not self.__running, timeout)
+            if self.__frame_count == self.__prev_count:
+                return None
+            self.__prev_count = self.__frame_count
             data = self.__latest_frame
 
-        return data
+        # copy=False: the maps point into SDK memory, kept alive by data.sdk_frames (hold few, the SDK pool is small)
+        if not copy:
+            return data
+
+        # copy=True: private maps, copied into pooled buffers instead of fresh allocations
+        frame = RealSenseFrame(self.__pool.copy(data.color_map), self.__pool.copy(data.depth_map),
+                               color_calibration=data.color_calibration,
+                               depth_calibration=data.depth_calibration,
+                               depth_to_color=data.depth_to_color,
+                               depth_scale=data.depth_scale,
+                               device_timestamp=data.device_timestamp,
+                               frame_number=data.frame_number,
+                               serial=data.serial)
+        frame.time_stamp = data.time_stamp
+        return frame
 
     @property
     def depth_scale(self):
         if self.__thread.is_alive():
-            return self.__pipeline.get_active_profile().get_device().first_depth_sensor().get_depth_scale() * 1000
+            return self.__depth_scale
         else:
             return 0  # If the current depth sensor is offline, return 0 to make it obvious
 
@@ -189,53 +682,66 @@ class RealSenseCamera:
         pt = rs.rs2_project_point_to_pixel(intrinsics, [x, y, z])
         return pt
 
+    def unproject_pixels(self, uv, depth, sensor="color"):
+        """ Batch version of unproject_pt_to_xyz: (N, 2) pixels and (N,) depths to (N, 3) points """
+
+        return deproject_pixels(self.__get_intrinsics(sensor), uv, depth)
+
+    def project_points(self, xyz, sensor="color"):
+        """ Batch version of project_xyz_to_pt: (N, 3) points to (N, 2) pixels """
+
+        return project_points(self.__get_intrinsics(sensor), xyz)
+
     @property
     def depth_intrinsics(self):
 
-        intrinsics = rs.video_stream_profile(self.__depth_frame.profile).get_intrinsics()
-        return intrinsics_to_numpy(intrinsics)
+        calibration = self.__get_calibration("depth")
+        return calibration.camera_matrix, calibration.distortion
 
     @property
     def color_intrinsics(self):
 
-        intrinsics = rs.video_stream_profile(self.__color_frame.profile).get_intrinsics()
-        return intrinsics_to_numpy(intrinsics)
+        calibration = self.__get_calibration("color")
+        return calibration.camera_matrix, calibration.distortion
 
-    def __get_intrinsics(self, sensor):
+    @property
+    def depth_to_color_extrinsics(self):
+
+        return extrinsics_to_numpy(self.__depth_to_color)
 
+    def __get_calibration(self, sensor):
+
+        # Cached by the camera thread, follows profile changes (e.g. decimation)
         if sensor == "color":
-            frame = self.__color_frame
+            return self.__color_calibration
         elif sensor == "depth":
-            frame = self.__depth_frame
+            return self.__depth_calibration
         else:
             raise NotImplementedError("selected sensor intrinsics are not implemented")
 
-        # Grab new intrinsics (may be changed by decimation)
-        return rs.video_stream_profile(frame.profile).get_intrinsics()
+    def __get_intrinsics(self, sensor):
+
+        return self.__get_calibration(sensor).intrinsics
 
 
 """ MAIN """
 
 if __name__ == "__main__":
 
-    devices = rs.context().query_devices()
-    print("Devices")
-    for device in devices:
-        print(device)
+    print("Devices", connected_devices())
 
     # Instantiate the realsense camera and start
+    # Without a camera: RealSenseCamera(source="recording.bag") or RealSenseCamera(source=SyntheticSource())
     camera = RealSenseCamera()
     camera.start_async()
     
-    devices = rs.context().query_devices()
-    for device in devices:
-        print(device)
-    
     # Main loop
     while camera.is_alive:
 
         # Get the latest image frame (this is blocking!)
         frame = camera.get_latest_frame()
+        if frame is None:
+            break
 
         # Sensor maps may be accessed
         color_image = frame.color_map
@@ -243,9 +749,7 @@ if __name__ == "__main__":
 
         # Do something with color and depth maps
 
-        # View the processed sensor data
-        depth_image = cv2.convertScaleAbs(depth_image, alpha=0.03)               # Scale depth from 16 to 8 bit
-        depth_image = cv2.normalize(depth_image, None, 0, 255, cv2.NORM_MINMAX)  # Normalize map
-        depth_image = cv2.applyColorMap(depth_image, cv2.COLORMAP_JET)           # Apply colormap
+        # View the processed sensor data, derived maps like the colorized depth are computed once per frame
+        depth_image = frame.depth_colormap                                       # Depth scaled to 8 bit, colormap
         cv2.imshow("Stream", np.hstack((color_image, depth_image)))              # Display color and depth maps together
         cv2.waitKey(1)                                                           # Wait 1 millisecond
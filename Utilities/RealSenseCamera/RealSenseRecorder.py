@@ -0,0 +1,346 @@
+""" IMPORTS """
+
+import os
+import json
+import time
+import queue
+import datetime
+import cv2 as cv2
+import numpy as np
+import pyrealsense2 as rs
+from threading import Thread, Condition, Semaphore, Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from RealSenseCamera import RealSenseFrame, StreamCalibration
+
+
+""" CONSTANTS """
+
+# One fixed size row per frame, row i sits at byte i * INDEX.itemsize of index.bin
+INDEX = np.dtype([("frame_number", "<i8"),
+                  ("device_timestamp", "<f8"),     # ms, NaN when unknown
+                  ("time_stamp", "<f8"),           # RealSenseFrame.time_stamp as seconds
+                  ("chunk", "<i4"),
+                  ("offset", "<i8"),
+                  ("depth_size", "<i4"),
+                  ("color_size", "<i4")])
+
+
+""" FUNCTIONS """
+
+def intrinsics_to_dict(intrinsics: rs.intrinsics):
+
+    return {"width": intrinsics.width, "height": intrinsics.height,
+            "fx": intrinsics.fx, "fy": intrinsics.fy, "ppx": intrinsics.ppx, "ppy": intrinsics.ppy,
+            "model": int(intrinsics.model), "coeffs": list(intrinsics.coeffs)}
+
+
+def intrinsics_from_dict(values):
+
+    intrinsics = rs.intrinsics()
+    for name in ("width", "height", "fx", "fy", "ppx", "ppy", "coeffs"):
+        setattr(intrinsics, name, values[name])
+    intrinsics.model = rs.distortion(values["model"])
+    return intrinsics
+
+
+""" CLASSES """
+
+class RealSenseRecorder:
+    """ Records frames to a directory: depth as lossless 16 bit PNG, color as JPEG, in chunk files with an index """
+
+    def __init__(self, path, chunk_frames=300, jpeg_quality=90, png_compression=1, workers=None, max_pending=32):
+
+        # Usable as a sink: RealSenseCamera(on_update=RealSenseRecorder("recording"))
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.__depth_params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        self.__color_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+
+        self.__index_file = open(os.path.join(path, "index.bin"), "ab")
+        self.__count = self.__index_file.tell() // INDEX.itemsize
+        self.__chunk_file = None
+        self.__chunk = -1
+        self.__meta_written = os.path.exists(os.path.join(path, "meta.json"))
+
+        # Encoding runs in a pool (cv2 releases the GIL), one writer thread keeps the frames in order
+        self.__pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="RealSenseRecorder")
+        # A slot is reserved before a frame is submitted, so frames that do not fit are never encoded
+        self.__slots = Semaphore(max_pending)
+        self.__pending = queue.Queue()
+        self.__writer = Thread(target=self.__writer_thread, daemon=True)
+        self.__writer.start()
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def __call__(self, frame):
+        self.write(frame)
+
+    def write(self, frame: RealSenseFrame):
+
+        # Never blocks the camera thread: when encoding falls behind the frame is dropped (and counted)
+        # The maps are copied so the SDK frames are released right away
+        header = (frame.frame_number, frame.device_timestamp, frame.time_stamp.timestamp())
+        if not self.__meta_written:
+            self.__write_meta(frame)
+
+        if not self.__slots.acquire(blocking=False):
+            self.dropped += 1
+            return False
+
+        self.__pending.put((header, self.__pool.submit(self.__encode, frame.depth_map.copy(), frame.color_map.copy())))
+        return True
+
+    def __write_meta(self, frame):
+
+        meta = {"depth_scale": frame.depth_scale, "serial": frame.serial}
+        for name, calibration in (("color", frame.color_calibration), ("depth", frame.depth_calibration)):
+            if calibration is not None:
+                meta[f"{name}_intrinsics"] = intrinsics_to_dict(calibration.intrinsics)
+
+        with open(os.path.join(self.path, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=2)
+        self.__meta_written = True
+
+    def __encode(self, depth_map, color_map):
+
+        _, depth = cv2.imencode(".png", depth_map, self.__depth_params)
+        _, color = cv2.imencode(".jpg", color_map, self.__color_params)
+        return depth.tobytes(), color.tobytes()
+
+    def __writer_thread(self):
+
+        while True:
+            item = self.__pending.get()
+            if item is None:
+                break
+
+            (frame_number, device_timestamp, time_stamp), future = item
+            try:
+                depth, color = future.result()
+            except Exception:
+                # A frame that failed to encode is skipped, the recording goes on
+                self.failed += 1
+                continue
+            finally:
+                self.__slots.release()
+
+            # Start a new chunk every chunk_frames frames
+            chunk = self.__count // self.chunk_frames
+            if chunk != self.__chunk:
+                if self.__chunk_file is not None:
+                    self.__chunk_file.close()
+                    self.__index_file.flush()
+                self.__chunk_file = open(os.path.join(self.path, f"chunk_{chunk:05d}.dat"), "ab")
+                self.__chunk = chunk
+
+            row = np.zeros(1, INDEX)
+            row["frame_number"] = frame_number if frame_number is not None else self.__count
+            row["device_timestamp"] = device_timestamp if device_timestamp is not None else np.nan
+            row["time_stamp"] = time_stamp
+            row["chunk"] = chunk
+            row["offset"] = self.__chunk_file.tell()
+            row["depth_size"] = len(depth)
+            row["color_size"] = len(color)
+
+            self.__chunk_file.write(depth)
+            self.__chunk_file.write(color)
+            self.__index_file.write(row.tobytes())
+            self.__count += 1
+            self.written += 1
+
+    def stats(self):
+
+        return {"written": self.written, "dropped": self.dropped, "failed": self.failed,
+                "pending": self.__pending.qsize()}
+
+    def close(self):
+
+        # Waits until every accepted frame is on disk, the queue is unbounded so the sentinel never blocks
+        self.__pending.put_nowait(None)
+        self.__writer.join()
+        self.__pool.shutdown()
+        if self.__chunk_file is not None:
+            self.__chunk_file.close()
+        self.__index_file.close()
+
+
+class RealSenseRecording:
+    """ Random access to a recording, and a frame source with the RealSenseCamera interface """
+
+    def __init__(self, path, on_update=None):
+
+        self.path = path
+        self.index = np.fromfile(os.path.join(path, "index.bin"), dtype=INDEX)
+
+        meta_path = os.path.join(path, "meta.json")
+        self.meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as file:
+                self.meta = json.load(file)
+
+        self.color_calibration = self.__calibration("color")
+        self.depth_calibration = self.__calibration("depth")
+        self.__chunk_files = {}
+        self.__read_lock = Lock()
+
+        # Playback state, see start_async
+        self.__callback = on_update
+        self.__cond = Condition()
+        self.__thread = Thread()
+        self.__kill = False
+        self.__running = False
+        self.__latest_frame = None
+        self.__frame_count = 0
+        self.__prev_count = 0
+
+    def __calibration(self, name):
+
+        values = self.meta.get(f"{name}_intrinsics")
+        return StreamCalibration.from_intrinsics(intrinsics_from_dict(values)) if values else None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+
+        # O(1): the index row gives the chunk and byte offset of frame i
+        row = self.index[i]
+        chunk = int(row["chunk"])
+        if chunk not in self.__chunk_files:
+            self.__chunk_files[chunk] = open(os.path.join(self.path, f"chunk_{chunk:05d}.dat"), "rb")
+
+        # seek + read on a shared file object, the lock keeps the pair together when several threads read
+        depth_size, color_size = int(row["depth_size"]), int(row["color_size"])
+        with self.__read_lock:
+            file = self.__chunk_files[chunk]
+            file.seek(int(row["offset"]))
+            data = file.read(depth_size + color_size)
+        depth_map = cv2.imdecode(np.frombuffer(data, np.uint8, depth_size), cv2.IMREAD_UNCHANGED)
+        color_map = cv2.imdecode(np.frombuffer(data, np.uint8, color_size, depth_size), cv2.IMREAD_COLOR)
+
+        device_timestamp = float(row["device_timestamp"])
+        frame = RealSenseFrame(color_map, depth_map,
+                               color_calibration=self.color_calibration,
+                               depth_calibration=self.depth_calibration,
+                               depth_scale=self.meta.get("depth_scale"),
+                               device_timestamp=None if np.isnan(device_timestamp) else device_timestamp,
+                               frame_number=int(row["frame_number"]),
+                               serial=self.meta.get("serial"))
+        frame.time_stamp = datetime.datetime.fromtimestamp(float(row["time_stamp"]))
+        return frame
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def find_frame_number(self, frame_number):
+        """ Position of a frame number in the recording (binary search, frame numbers only increase) """
+        return int(np.searchsorted(self.index["frame_number"], frame_number))
+
+    def find_time(self, time_stamp):
+        """ Position of the first frame at or after a RealSenseFrame.time_stamp (datetime) """
+        return int(np.searchsorted(self.index["time_stamp"], time_stamp.timestamp()))
+
+    # RealSenseCamera interface, so a recording can replace the camera in the examples
+
+    def start_async(self, realtime=True, start=0):
+
+        if self.__thread.is_alive():
+            return
+
+        self.__kill = False
+        self.__running = True
+        self.__thread = Thread(target=self.__play_thread, args=(realtime, start), daemon=True)
+        self.__thread.start()
+
+    def stop_async(self):
+
+        if self.__thread.is_alive():
+            self.__kill = True
+            self.__thread.join()
+
+    def __play_thread(self, realtime, start):
+
+        t0 = time.perf_counter()
+        try:
+            for i in range(start, len(self)):
+                if self.__kill:
+                    break
+
+                # Recorded timing, relative to the first frame played
+                if realtime:
+                    delay = t0 + self.index["time_stamp"][i] - self.index["time_stamp"][start] - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                data = self[i]
+                if callable(self.__callback):
+                    self.__callback(data)
+
+                with self.__cond:
+                    self.__latest_frame = data
+                    self.__frame_count += 1
+                    self.__cond.notify_all()
+        finally:
+            with self.__cond:
+                self.__running = False
+                self.__cond.notify_all()
+
+    def get_latest_frame(self, copy=True, timeout=None):
+
+        # Decoded frames are private already, copy is accepted for compatibility
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__frame_count != self.__prev_count or not self.__running, timeout)
+            if self.__frame_count == self.__prev_count:
+                return None
+            self.__prev_count = self.__frame_count
+            return self.__latest_frame
+
+    @property
+    def depth_scale(self):
+        return self.meta.get("depth_scale", 0)
+
+    @property
+    def is_alive(self):
+        return self.__thread.is_alive()
+
+    def close(self):
+
+        self.stop_async()
+        for file in self.__chunk_files.values():
+            file.close()
+        self.__chunk_files = {}
+
+
+""" MAIN """
+
+if __name__ == "__main__":
+
+    from RealSenseCamera import RealSenseCamera
+
+    # Record 10 seconds, then play the recording back
+    recorder = RealSenseRecorder("recording")
+    camera = RealSenseCamera(on_update=recorder)
+    camera.start_async()
+    time.sleep(10)
+    camera.stop_async()
+    recorder.close()
+    print(recorder.stats())
+
+    recording = RealSenseRecording("recording")
+    print(f"{len(recording)} frames, frame 100 at {recording[min(100, len(recording) - 1)].time_stamp}")
+
+    recording.start_async(realtime=True)
+    while recording.is_alive:
+        frame = recording.get_latest_frame(timeout=1.0)
+        if frame is None:
+            continue
+        cv2.imshow("Recording", np.hstack((frame.color_map, frame.depth_colormap)))
+        cv2.waitKey(1)
+
+    recording.close()
+    cv2.destroyAllWindows()
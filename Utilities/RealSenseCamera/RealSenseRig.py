@@ -0,0 +1,133 @@
+""" IMPORTS """
+
+import time
+import cv2 as cv2
+import numpy as np
+from threading import Condition
+from collections import deque
+from functools import partial
+
+from RealSenseCamera import RealSenseCamera, connected_devices
+
+
+""" CLASSES """
+
+class RealSenseRig:
+
+    def __init__(self, serials=None, tolerance=15.0, hardware_sync=False, history=3, **camera_kwargs):
+
+        # serials: devices to open (all connected devices by default)
+        # tolerance: largest difference in ms between the frames of one set
+        # hardware_sync: first device drives the others over the sync cable
+        # history: frames kept per device for matching, keep it small, the frames hold SDK memory
+        self.serials = list(serials) if serials is not None else connected_devices()
+        if not self.serials:
+            raise ValueError("no realsense device connected" if serials is None else "serials is empty")
+        self.tolerance = tolerance
+
+        self.__cond = Condition()
+        self.__history = [deque(maxlen=history) for _ in self.serials]
+        self.__latest_frames = None
+        self.__set_count = 0
+        self.__prev_count = 0
+        self.__offsets = [0.0] * len(self.serials)
+        self.__max_offset = 0.0
+
+        # One camera (pipeline and thread) per device, the SDK releases the GIL so each device gets its own core
+        self.cameras = [RealSenseCamera(on_update=partial(self.__on_frame, i), serial=serial,
+                                        sync_mode=(1 if i == 0 else 2) if hardware_sync else None, **camera_kwargs)
+                        for i, serial in enumerate(self.serials)]
+
+    def start_async(self):
+
+        for camera in self.cameras:
+            camera.start_async()
+
+    def stop_async(self):
+
+        for camera in self.cameras:
+            camera.stop_async()
+
+    def __on_frame(self, index, frame):
+
+        with self.__cond:
+            self.__history[index].append(frame)
+            if not all(self.__history):
+                return
+
+            # The newest frame anchors the set, every other device adds its frame closest in time
+            t = frame.device_timestamp
+            frames = tuple(min(history, key=lambda f: abs(f.device_timestamp - t)) for history in self.__history)
+            times = [f.device_timestamp for f in frames]
+            if max(times) - min(times) > self.tolerance:
+                return
+
+            # A frame is only used in one set
+            if self.__latest_frames is not None and any(a is b for a, b in zip(frames, self.__latest_frames)):
+                return
+
+            self.__latest_frames = frames
+            self.__offsets = [ts - times[0] for ts in times]
+            self.__max_offset = max(self.__max_offset, max(abs(offset) for offset in self.__offsets))
+            self.__set_count += 1
+            self.__cond.notify_all()
+
+    def get_latest_frames(self, timeout=None):
+
+        # Block until a new synchronized set, a tuple of RealSenseFrame in the order of self.serials
+        # None on timeout or when a camera stopped
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__cond:
+            while self.__set_count == self.__prev_count:
+                if not self.is_alive:
+                    return None
+                remaining = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+                if remaining <= 0:
+                    return None
+                self.__cond.wait(remaining)
+
+            self.__prev_count = self.__set_count
+            return self.__latest_frames
+
+    @property
+    def offsets(self):
+        # Time in ms of each device's frame relative to the first device, for the latest set
+        with self.__cond:
+            return list(self.__offsets)
+
+    @property
+    def is_alive(self):
+        return all(camera.is_alive for camera in self.cameras)
+
+    def stats(self):
+
+        with self.__cond:
+            return {"sets": self.__set_count,
+                    "offsets": list(self.__offsets),
+                    "max_offset": self.__max_offset}
+
+
+""" MAIN """
+
+if __name__ == "__main__":
+
+    rig = RealSenseRig()
+    rig.start_async()
+
+    while rig.is_alive:
+
+        frames = rig.get_latest_frames(timeout=1.0)
+        if frames is None:
+            continue
+
+        view = np.hstack([frame.color_map for frame in frames])
+        cv2.putText(view, f"offsets {[round(offset, 2) for offset in rig.offsets]} ms", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        cv2.imshow("RealSense Rig", view)
+
+        if cv2.waitKey(1) & 0xFF == 27:
+            break
+
+    print(rig.stats())
+    rig.stop_async()
+    cv2.destroyAllWindows()
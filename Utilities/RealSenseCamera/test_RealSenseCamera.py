@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+rs = pytest.importorskip("pyrealsense2")
+
+from RealSenseCamera import deproject_pixels, project_points
+
+
+MODELS = ["none", "brown_conrady", "inverse_brown_conrady", "modified_brown_conrady"]
+
+# Pixels across the whole image, the corners have the strongest distortion
+PIXELS = np.stack(np.meshgrid(np.linspace(0, 639, 9), np.linspace(0, 479, 7)), axis=-1).reshape(-1, 2)
+
+
+def make_intrinsics(model):
+    intrinsics = rs.intrinsics()
+    intrinsics.width, intrinsics.height = 640, 480
+    intrinsics.fx, intrinsics.fy = 615.0, 615.5
+    intrinsics.ppx, intrinsics.ppy = 320.5, 240.2
+    intrinsics.model = getattr(rs.distortion, model)
+    intrinsics.coeffs = [0.12, -0.25, 0.001, -0.0015, 0.09]
+    return intrinsics
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_deproject_inverts_project(model):
+    intrinsics = make_intrinsics(model)
+    points = deproject_pixels(intrinsics, PIXELS, np.full(len(PIXELS), 1.5))
+    np.testing.assert_allclose(points[:, 2], 1.5)
+    np.testing.assert_allclose(project_points(intrinsics, points), PIXELS, atol=1e-3)
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_project_matches_sdk(model):
+    intrinsics = make_intrinsics(model)
+    points = deproject_pixels(intrinsics, PIXELS, np.full(len(PIXELS), 1.5))
+    expected = [rs.rs2_project_point_to_pixel(intrinsics, list(point)) for point in points]
+    np.testing.assert_allclose(project_points(intrinsics, points), expected, atol=1e-2)
+
+
+# The SDK has no deprojection for modified brown conrady, and its brown conrady iteration only
+# approximately inverts its own projection, so only these models are compared point by point
+@pytest.mark.parametrize("model", ["none", "inverse_brown_conrady"])
+def test_deproject_matches_sdk(model):
+    intrinsics = make_intrinsics(model)
+    expected = [rs.rs2_deproject_pixel_to_point(intrinsics, list(pixel), 1.5) for pixel in PIXELS]
+    np.testing.assert_allclose(deproject_pixels(intrinsics, PIXELS, np.full(len(PIXELS), 1.5)), expected, atol=1e-4)